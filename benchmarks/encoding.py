@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+Compares the Json and the MessagePack encoding of dojango (json_encode vs.
+msgpack_encode) for a dojo.data store like payload.
+
+Usage:
+
+    python benchmarks/encoding.py [number of items] [number of columns]
+"""
+import datetime
+import sys
+import timeit
+from decimal import Decimal
+
+from django.conf import settings
+if not settings.configured:
+    settings.configure()
+
+from dojango.util import json_encode, json_decode, msgpack_encode, msgpack_decode, msgpack
+
+def build_payload(num_items, num_columns):
+    items = []
+    for i in xrange(num_items):
+        item = {'id': i, 'label': u'Item %d' % i,
+                'created': datetime.datetime(2009, 10, 2, 12, 0, i % 60),
+                'price': Decimal('%d.99' % i),
+                'owner': {'_reference': 'auth.user__%d' % (i % 10)}}
+        for c in xrange(num_columns - len(item)):
+            item['column_%d' % c] = (c % 2) and i * c or u'value %d/%d' % (i, c)
+        items.append(item)
+    return {'identifier': 'id', 'label': 'label', 'items': items}
+
+def bench(name, func, number):
+    best = min(timeit.repeat(func, number=number, repeat=3))
+    print '%-20s %8.2f ms' % (name, best / number * 1000)
+
+def main(num_items=1000, num_columns=50):
+    if msgpack is None:
+        print 'Install the msgpack package to run this benchmark.'
+        sys.exit(1)
+    data = build_payload(num_items, num_columns)
+    json_data = json_encode(data)
+    msgpack_data = msgpack_encode(data)
+    print '%d items with %d columns' % (num_items, num_columns)
+    print '%-20s %8d bytes' % ('json size', len(json_data))
+    print '%-20s %8d bytes' % ('msgpack size', len(msgpack_data))
+    bench('json encode', lambda: json_encode(data), 10)
+    bench('msgpack encode', lambda: msgpack_encode(data), 10)
+    bench('json decode', lambda: json_decode(json_data), 10)
+    bench('msgpack decode', lambda: msgpack_decode(msgpack_data), 10)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
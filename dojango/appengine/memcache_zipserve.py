@@ -42,7 +42,12 @@ from google.appengine.api import memcache
 from google.appengine.ext import webapp
 from google.appengine.ext.webapp import util
 
-from django.utils.hashcompat import md5_constructor
+def get_etag(crc, size):
+  """The ETag of a zipped file, built of the CRC32 and size stored in the zip
+  directory. (Nothing is imported from dojango here, this module is loaded
+  before the Django environment is set up, see dojo_serve.py)
+  """
+  return '"%08x-%x"' % (crc & 0xffffffff, size)
 
 def create_handler(zip_files, max_age=None, public=None, client_caching=None):
   """Factory method to create a MemcachedZipHandler instance.
@@ -214,12 +219,11 @@ class MemcachedZipHandler(webapp.RequestHandler):
         # with that
         try:
           resp_data = CacheFile()
-          info = os.stat(archive_name)
-          #lastmod = datetime.datetime.fromtimestamp(info[8])
-          lastmod = datetime.datetime(*zip_archive.getinfo(file_path).date_time)
+          info = zip_archive.getinfo(file_path)
           resp_data.file = zip_archive.read(file_path)
-          resp_data.lastmod = lastmod
-          resp_data.etag = '"%s"' % md5_constructor(resp_data.file).hexdigest()
+          resp_data.lastmod = datetime.datetime(*info.date_time)
+          # the zip directory has a checksum already, no need to hash the file
+          resp_data.etag = get_etag(info.CRC, info.file_size)
         except (KeyError, RuntimeError), err:
           # no op
           x = False
@@ -22,6 +22,23 @@ DOJO_THEME = getattr(settings, "DOJANGO_DOJO_THEME", "claro")
 DOJO_DEBUG = getattr(settings, "DOJANGO_DOJO_DEBUG", DEBUG) # using the default django DEBUG setting
 DOJO_SECURE_JSON = getattr(settings, "DOJANGO_DOJO_SECURE_JSON", True) # if you are using dojo version < 1.2.0 you have set it to False
 CDN_USE_SSL = getattr(settings, "DOJANGO_CDN_USE_SSL", False) # is dojo served via https from google? doesn't work for aol!
+# execute the calls of a JSON-RPC batch request (see modelstore.JsonService) concurrently on a thread pool
+JSONRPC_BATCH_PARALLEL = getattr(settings, "DOJANGO_JSONRPC_BATCH_PARALLEL", False)
+JSONRPC_BATCH_MAX_WORKERS = getattr(settings, "DOJANGO_JSONRPC_BATCH_MAX_WORKERS", 4)
+# JSON-RPC notifications (calls without an id) are executed in the background (see modelstore.notifications)
+JSONRPC_NOTIFICATION_QUEUE = getattr(settings, "DOJANGO_JSONRPC_NOTIFICATION_QUEUE", "dojango.data.modelstore.notifications.MemoryQueue") # class or dotted path
+JSONRPC_NOTIFICATION_QUEUE_SIZE = getattr(settings, "DOJANGO_JSONRPC_NOTIFICATION_QUEUE_SIZE", 1000) # full queue -> the call is executed within the request
+JSONRPC_NOTIFICATION_WORKERS = getattr(settings, "DOJANGO_JSONRPC_NOTIFICATION_WORKERS", 2)
+# aggregate timing/query/size statistics of servicemethod calls (see modelstore.instrumentation)
+SERVICEMETHOD_STATS = getattr(settings, "DOJANGO_SERVICEMETHOD_STATS", False)
+SERVICEMETHOD_STATS_FLUSH_INTERVAL = getattr(settings, "DOJANGO_SERVICEMETHOD_STATS_FLUSH_INTERVAL", 10) # seconds
+# client-side cache lifetime (in seconds) of GET responses of idempotent servicemethods (see modelstore.servicemethod)
+SERVICEMETHOD_MAX_AGE = getattr(settings, "DOJANGO_SERVICEMETHOD_MAX_AGE", 0)
+# changes logged up to that many seconds before a delta token are read again with the next delta request,
+# so changes of transactions that committed after the token was taken aren't lost (see modelstore.delta)
+DELTA_SAFETY_WINDOW = getattr(settings, "DOJANGO_DELTA_SAFETY_WINDOW", 60)
+# client-side cache lifetime (in seconds) of the SMD served with /store/url/?smd
+SMD_MAX_AGE = getattr(settings, "DOJANGO_SMD_MAX_AGE", 86400)
 
 # set the urls for actual possible paths for dojo
 # one dojo profile must at least contain a path that defines the base url of a dojo installation
@@ -1,5 +1,9 @@
 import re
 
+from dojango.util import is_number
+from dojango.lru import LRUCache
+from jsonquery import JsonQueryError, parse_filter, compile_filter
+
 __all__ = ('QueryInfo', 'QueryReadStoreInfo', 
             'JsonRestStoreInfo', 'JsonQueryRestStoreInfo',)
 
@@ -7,30 +11,85 @@ class QueryInfoFeatures(object):
     sorting = True
     paging = False
 
+# The extracted query information of recent requests,
+# keyed by the class and the normalized query (see QueryInfo.get_query_key)
+_parsed_queries = LRUCache(1000)
+
 class QueryInfo(object):
     '''Usage (is that the right solution?):
         info = QueryInfo(request)
         info.extract()
-        queryset = extract.process(Object.objects.all())
+        queryset = info.process(Object.objects.all())
+        
+    The query state (start, end, filters, sorting) belongs to the instance,
+    the request isn't modified.  Requests with the same normalized query
+    share the extracted state, so it is parsed just once.
     '''
     start = 0
     end = 25
-    filters = {}
-    sorting = [] # key=field // value=descending(True/False)
     
     request = None
     max_count = 25
     
+    # The attributes set by the set_* methods that make up the state
+    state_attrs = ('start', 'end', 'filters', 'sorting')
+    
     def __init__(self, request, max_count=None, **kwargs):
         self.request = request
         if max_count is not None:
             self.max_count = max_count
-
+        self.filters = {}
+        self.sorting = [] # -sort_field (descending) / sort_field (ascending)
+        self.params = self.get_params()
+    
+    def get_params(self):
+        """Returns a copy of the request parameters the set_* methods
+        work on (GET or POST)."""
+        if self.request.method == 'POST':
+            return dict(self.request.POST.items())
+        return dict(self.request.GET.items())
+    
+    def get_query_key(self):
+        """Returns the normalized query the state is extracted from,
+        requests with the same key get the same state (None disables
+        the caching)."""
+        return (self.__class__, self.max_count, tuple(sorted(self.params.items())))
+    
     def extract(self):
-        self.set_paging()
-        self.set_sorting()
-        self.set_filters()
-        
+        key = self.get_query_key()
+        state = key is not None and _parsed_queries.get(key) or None
+        if state is None:
+            self.set_paging()
+            self.set_sorting()
+            self.set_filters()
+            state = self.get_state()
+            if key is not None:
+                _parsed_queries.set(key, state)
+        self.set_state(state)
+    
+    def get_state(self):
+        """Returns the extracted state as an immutable tuple."""
+        state = []
+        for attr in self.state_attrs:
+            value = getattr(self, attr)
+            if isinstance(value, dict):
+                value = ('dict', tuple(sorted(value.items())))
+            elif isinstance(value, list):
+                value = ('list', tuple(value))
+            else:
+                value = (None, value)
+            state.append(value)
+        return tuple(state)
+    
+    def set_state(self, state):
+        """Sets the attributes from a state (a fresh copy for each instance)."""
+        for attr, (kind, value) in zip(self.state_attrs, state):
+            if kind == 'dict':
+                value = dict(value)
+            elif kind == 'list':
+                value = list(value)
+            setattr(self, attr, value)
+    
     def set_paging(self):
         """Needs to be implemented in a subclass"""
         pass
@@ -58,9 +117,9 @@ class QueryReadStoreInfo(QueryInfo):
         Parameters could be passed within GET or POST.
     """
     def set_paging(self):
-        start = self.request[self.request.method].pop('start', 0)
+        start = self.params.pop('start', 0)
         # TODO: start = 1???
-        count = self.request[self.request.method].pop('count', 25)
+        count = self.params.pop('count', 25)
         #if not is_number(end): # The dojo combobox may return "Infinity" tsss
         if not is_number(count) or int(count) > self.max_count:
             count = self.max_count
@@ -70,13 +129,13 @@ class QueryReadStoreInfo(QueryInfo):
     def set_sorting(self):
         # REQUEST['sort']:
         # value: -sort_field (descending) / sort_field (ascending)
-        sort_attr = self.request[self.request.method].pop('sort', None)
+        sort_attr = self.params.pop('sort', None)
         if sort_attr:
             self.sorting.append(sort_attr)
     
     def set_filters(self):
         query_dict = {}
-        for k,v in self.request[self.request.method].items():
+        for k,v in self.params.items():
             query_dict[k] = v
 
 class JsonRestStoreInfo(QueryReadStoreInfo):
@@ -92,13 +151,18 @@ class JsonRestStoreInfo(QueryReadStoreInfo):
         
         Sorting is just possible with JsonQueryReadStoreInfo.
     """
+    def get_query_key(self):
+        key = super(JsonRestStoreInfo, self).get_query_key()
+        return key + (self.request.META.get('HTTP_RANGE', self.request.META.get('HTTP_X_RANGE')),)
+    
     def set_paging(self):
         # Receiving the following header:
         # Range: items=0-24
         # Returning: Content-Range: items 0-24/66
-        if 'RANGE' in self.META:
+        range_header = self.request.META.get('HTTP_RANGE', self.request.META.get('HTTP_X_RANGE'))
+        if range_header:
             regexp = re.compile(r"^\s*items=(\d+)-(\d+)", re.I)
-            match = regexp.match(self.META['RANGE'])
+            match = regexp.match(range_header)
             if match:
                 start, end = match.groups()
                 start, end = int(start), int(end)+1 # range-end means including that element!
@@ -112,13 +176,21 @@ class JsonRestStoreInfo(QueryReadStoreInfo):
         # sorting is not available in the normal JsonRestStore
         pass
 
+    def set_filters(self):
+        # the remaining GET parameters are the filters
+        self.filters = dict(self.params)
+
 class JsonQueryRestStoreInfo(QueryInfo):
     jsonpath = None
     jsonpath_filters = None
     jsonpath_sorting = None
     jsonpath_paging = None
+    filter_tree = None
+    allowed_fields = None
+    
+    state_attrs = QueryInfo.state_attrs + ('filter_tree',)
     
-    def __init__(self, request, **kwargs):
+    def __init__(self, request, allowed_fields=None, **kwargs):
         """
             Matching the following example jsonpath:
             
@@ -127,7 +199,14 @@ class JsonQueryRestStoreInfo(QueryInfo):
             The last part of the URL will contain a JSONPath-query:
             
                 [filter][sort][start:end:step]
+            
+            The filter is parsed with dojango.data.jsonquery, just the
+            fields in 'allowed_fields' can be used in it (a list of names or
+            a dict mapping them to model field lookups).  By default
+            these are the (non-relational) fields of the queried model.
         """
+        if allowed_fields is not None:
+            self.allowed_fields = allowed_fields
         path = request.path
         if not path.endswith("/"):
             path = path + "/"
@@ -149,16 +228,21 @@ class JsonQueryRestStoreInfo(QueryInfo):
                 elif re.match(r'^\d*:\d*:{0,1}\d*$', part):
                     self.jsonpath_paging = part
         super(JsonQueryRestStoreInfo, self).__init__(request, **kwargs)
+    
+    def get_query_key(self):
+        return (self.__class__, self.max_count, self.jsonpath)
         
     def set_paging(self):
         # handling 0:24
+        if not self.jsonpath_paging:
+            return
         match = re.match(r'^(\d*):(\d*):{0,1}\d*$', self.jsonpath_paging)
         if match:
             start, end = match.groups()
-            if(start.length == 0):
+            if not start:
                 start = 0
-            if(end.length == 0):
-                end = int(start) + self.max_count
+            if not end:
+                end = int(start) + self.max_count - 1
             start, end = int(start), int(end)+1 # second argument means the element should be included!
             self.start = start
             count = self.max_count
@@ -167,16 +251,36 @@ class JsonQueryRestStoreInfo(QueryInfo):
             self.end = start+count
     
     def set_sorting(self):
-        # handling /@['field1'],/@['field2']
-        for f in self.jsonpath_sorting.split(",/"):
+        # handling /@['field1'],\@['field2'] (/ ascending, \ descending)
+        if not self.jsonpath_sorting:
+            return
+        for f in re.split(r',(?=[\\/])', self.jsonpath_sorting):
             m = re.match(r"([\\/])@\['(.*)'\]", f)
             if m:
                 sort_prefix = "-"
                 direction, field = m.groups()
                 if direction == "/":
-                    descending = ""
+                    sort_prefix = ""
                 self.sorting.append(sort_prefix + field)
         
     def set_filters(self):
         # handling ?(@.field1='searchterm*'&@.field2~'*search*')
-        pass 
\ No newline at end of file
+        # (the parse tree is compiled in process, when the model is known)
+        if self.jsonpath_filters:
+            self.filter_tree = parse_filter(self.jsonpath_filters)
+
+    def get_filter(self, model):
+        """Returns the Q object of the filter (or None) -- raises a
+        JsonQueryError if a field isn't allowed."""
+        if self.filter_tree is None:
+            return None
+        allowed_fields = self.allowed_fields
+        if allowed_fields is None:
+            allowed_fields = [f.name for f in model._meta.fields if not f.rel]
+        return compile_filter(self.filter_tree, allowed_fields)
+
+    def process(self, queryset):
+        q = self.get_filter(queryset.model)
+        if q is not None:
+            queryset = queryset.filter(q)
+        return super(JsonQueryRestStoreInfo, self).process(queryset) 
\ No newline at end of file
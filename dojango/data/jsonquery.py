@@ -0,0 +1,212 @@
+""" A parser for the filter expressions of JSONQuery (as sent by
+    dojox.data.JsonQueryRestStore) that compiles them into Django Q objects.
+
+    >>> tree = parse_filter("?(@.name='Bil*'&(@.city~'*shire'|@.age>=111))")
+    >>> q = compile_filter(tree, allowed_fields=['name', 'city', 'age'])
+    >>> User.objects.filter(q)
+
+    Supported are:
+
+        @.field = 'value'       Equals ('*' and '?' are wildcards)
+        @.field ~ 'value'       Equals case-insensitive (with wildcards)
+        @.field != 'value'      Not equals (!~ case-insensitive)
+        @.field < 5             Comparisons (<, <=, >, >=)
+        &, |, ( )               And, or and grouping
+
+    Fields can be written as @.field, @['field'] or just field, dotted
+    fields (@.author.name) follow relations (author__name).  Values are
+    strings in single or double quotes, numbers, true, false and null.
+
+    Only whitelisted fields can be filtered, so clients can't query
+    arbitrary (ie private) fields or relations.
+"""
+
+import re
+
+from django.db.models import Q
+
+from dojango.lru import LRUCache
+
+__all__ = ('JsonQueryError', 'parse_filter', 'compile_filter')
+
+class JsonQueryError(ValueError):
+    """ Raised for invalid JSONQuery expressions or
+        fields that aren't allowed to be filtered
+    """
+    pass
+
+_token_re = re.compile(r"""
+    \s*(?:
+        (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")|
+        (?P<number>-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)|
+        (?P<field>@\[\s*(?:'[^']*'|"[^"]*")\s*\](?:\.\w+)*|@(?:\.\w+)+|[A-Za-z_]\w*(?:\.\w+)*)|
+        (?P<op>==|!=|!~|<=|>=|=|~|<|>)|
+        (?P<punct>[&|()])
+    )""", re.VERBOSE)
+
+_constants = {'true': True, 'false': False, 'null': None}
+
+def _tokenize(expression):
+    tokens = []
+    pos, length = 0, len(expression)
+    while pos < length:
+        if not expression[pos:].strip():
+            break
+        match = _token_re.match(expression, pos)
+        if match is None or match.end() == pos:
+            raise JsonQueryError('Invalid JSONQuery near "%s"' % expression[pos:])
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'string':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        elif kind == 'number':
+            if '.' in value or 'e' in value.lower():
+                value = float(value)
+            else:
+                value = int(value)
+        elif kind == 'field' and value in _constants:
+            kind, value = 'constant', _constants[value]
+        elif kind == 'field':
+            value = _get_field_name(value)
+        tokens.append((kind, value))
+    return tokens
+
+def _get_field_name(token):
+    # @.a.b / @['a'].b / a.b -> 'a.b'
+    if token.startswith('@['):
+        name, rest = token[2:].split(']', 1)
+        return name.strip()[1:-1] + rest
+    if token.startswith('@.'):
+        return token[2:]
+    return token
+
+class _Parser(object):
+    """ A recursive descent parser building the tree of an expression:
+
+        ('or', [nodes]), ('and', [nodes]) and ('cmp', field, op, value)
+    """
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.pos < len(self.tokens) and self.tokens[self.pos] or (None, None)
+
+    def next(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) or (value and token[1] != value):
+            raise JsonQueryError('Invalid JSONQuery, expected %s' % (value or kind or 'more'))
+        self.pos += 1
+        return token
+
+    def parse(self):
+        tree = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise JsonQueryError('Invalid JSONQuery, unexpected "%s"' % (self.peek()[1],))
+        return tree
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() == ('punct', '|'):
+            self.next()
+            nodes.append(self.parse_and())
+        return len(nodes) > 1 and ('or', nodes) or nodes[0]
+
+    def parse_and(self):
+        nodes = [self.parse_primary()]
+        while self.peek() == ('punct', '&'):
+            self.next()
+            nodes.append(self.parse_primary())
+        return len(nodes) > 1 and ('and', nodes) or nodes[0]
+
+    def parse_primary(self):
+        if self.peek() == ('punct', '('):
+            self.next()
+            tree = self.parse_or()
+            self.next('punct', ')')
+            return tree
+        field = self.next('field')[1]
+        op = self.next('op')[1]
+        kind, value = self.next()
+        if kind not in ('string', 'number', 'constant'):
+            raise JsonQueryError('Invalid JSONQuery value "%s"' % value)
+        return ('cmp', field, op == '==' and '=' or op, value)
+
+_tree_cache = LRUCache(256)
+
+def parse_filter(expression):
+    """ Parses a JSONQuery filter expression (with or without the
+        leading '?') into a tree, which is cached by the expression.
+
+        Raises a JsonQueryError if the expression is invalid.
+    """
+    tree = _tree_cache.get(expression)
+    if tree is None:
+        expr = expression.strip()
+        if expr.startswith('?'):
+            expr = expr[1:]
+        tree = _Parser(_tokenize(expr)).parse()
+        _tree_cache.set(expression, tree)
+    return tree
+
+def _get_wildcard_lookup(value, ignore_case):
+    """ Returns the lookup and value for a string that may contain
+        the wildcards '*' and '?'
+    """
+    prefix = ignore_case and 'i' or ''
+    if '*' not in value and '?' not in value:
+        return prefix + 'exact', value
+    inner = value.strip('*')
+    if '*' not in inner and '?' not in inner:
+        if value.startswith('*') and value.endswith('*'):
+            return prefix + 'contains', inner
+        if value.endswith('*'):
+            return prefix + 'startswith', inner
+        return prefix + 'endswith', inner
+    regex = '^%s$' % ''.join([ c == '*' and '.*' or c == '?' and '.' or re.escape(c) for c in value ])
+    return prefix + 'regex', regex
+
+def _compile_cmp(field, op, value, allowed_fields):
+    if field not in allowed_fields:
+        raise JsonQueryError('Filtering by "%s" is not allowed' % field)
+    path = allowed_fields[field]
+
+    if op in ('<', '<=', '>', '>='):
+        lookup = {'<': 'lt', '<=': 'lte', '>': 'gt', '>=': 'gte'}[op]
+        return Q(**{'%s__%s' % (path, lookup): value})
+
+    ignore_case = op in ('~', '!~')
+    if value is None:
+        q = Q(**{'%s__isnull' % path: True})
+    elif isinstance(value, basestring):
+        lookup, value = _get_wildcard_lookup(value, ignore_case)
+        q = Q(**{'%s__%s' % (path, lookup): value})
+    else:
+        q = Q(**{path: value})
+    return op.startswith('!') and ~q or q
+
+def compile_filter(tree, allowed_fields):
+    """ Compiles a parsed filter into a Q object.
+
+        'allowed_fields' is either a list of the field names that can be
+        used in the expression or a dict mapping them to the lookup
+        path of the model field (ie {'author': 'author__username'})
+    """
+    if not isinstance(allowed_fields, dict):
+        allowed_fields = dict([ (name, name.replace('.', '__')) for name in allowed_fields ])
+
+    kind = tree[0]
+    if kind == 'cmp':
+        return _compile_cmp(tree[1], tree[2], tree[3], allowed_fields)
+
+    q = None
+    for node in tree[1]:
+        node_q = compile_filter(node, allowed_fields)
+        if q is None:
+            q = node_q
+        elif kind == 'and':
+            q = q & node_q
+        else:
+            q = q | node_q
+    return q
@@ -5,13 +5,18 @@ from stores import Store, ModelQueryStore
 
 from methods import Method, ModelMethod, \
     ObjectMethod, StoreMethod, FieldMethod, ValueMethod, \
-    RequestArg, ModelArg, ObjectArg, FieldArg, StoreArg
+    RequestArg, ModelArg, ObjectArg, FieldArg, StoreArg, \
+    register_method, resolve_method
 
 from fields import StoreField, ReferenceField
 
-from services import BaseService, JsonService, servicemethod
+from services import BaseService, JsonService, servicemethod, \
+    invalidate_servicemethod, canonical_json
 
-from utils import get_object_from_identifier
+from utils import get_object_from_identifier, get_objects_from_identifiers, \
+    register_identifier_code
+
+from delta import track_changes, prune_changes
 
 __all__ = (
     'Store', 'ModelQueryStore',
@@ -20,10 +25,15 @@ __all__ = (
     'FieldMethod', 'ValueMethod',
 
     'RequestArg', 'ModelArg', 'ObjectArg', 'FieldArg', 'StoreArg',
+    'register_method', 'resolve_method',
 
     'StoreField', 'ReferenceField',
 
-    'BaseService', 'JsonService', 'servicemethod',
+    'BaseService', 'JsonService', 'servicemethod', 'invalidate_servicemethod',
+    'canonical_json',
+
+    'get_object_from_identifier', 'get_objects_from_identifiers',
+    'register_identifier_code',
 
-    'get_object_from_identifier'
+    'track_changes', 'prune_changes'
 )
@@ -0,0 +1,130 @@
+""" Change tracking for the delta mode of modelstore Stores
+
+    Track a model with:
+
+        >>> track_changes(MyModel)
+
+    Every save and delete of a MyModel instance will then be recorded as a
+    dojango.models.StoreChange entry.  A Store serving MyModel objects can
+    afterwards be called with a '?since=<token>' parameter and just returns
+    the items created or updated since that token, the identifiers of the
+    deleted items and a new token (see BaseStore.to_delta)
+
+    Note: QuerySet.update() and QuerySet.delete() on the database level
+    don't send signals for each object and won't be tracked.
+
+    A transaction that commits after a client got its token may have
+    logged its changes with lower pks than the token.  So the changes
+    logged within DOJANGO_DELTA_SAFETY_WINDOW seconds before the token are
+    read again with the next request -- clients can get an item again,
+    but don't miss changes of transactions shorter than that window.
+"""
+
+import datetime
+
+from django.db.models import signals, Max, Min
+from django.utils.encoding import smart_unicode
+
+from dojango.conf import settings
+
+__all__ = ('track_changes', 'get_change_token', 'is_valid_token',
+            'get_changes', 'prune_changes')
+
+def _get_model_label(Model):
+    """ Returns the <app_label>.<model_name> string used in item identifiers
+    """
+    return smart_unicode(Model._meta)
+
+def _log_change(instance, action):
+    from dojango.models import StoreChange
+    StoreChange.objects.create(
+        model=_get_model_label(instance.__class__),
+        object_pk=smart_unicode(instance._get_pk_val()),
+        action=action
+    )
+
+def _on_save(sender, instance, **kwargs):
+    from dojango.models import StoreChange
+    _log_change(instance, StoreChange.ACTION_SAVE)
+
+def _on_delete(sender, instance, **kwargs):
+    from dojango.models import StoreChange
+    _log_change(instance, StoreChange.ACTION_DELETE)
+
+def track_changes(*models):
+    """ Records saves and deletes of the given model classes in the
+        StoreChange log.
+    """
+    for Model in models:
+        signals.post_save.connect(_on_save, sender=Model,
+            dispatch_uid='dojango_track_save_%s' % _get_model_label(Model))
+        signals.post_delete.connect(_on_delete, sender=Model,
+            dispatch_uid='dojango_track_delete_%s' % _get_model_label(Model))
+
+def get_change_token():
+    """ Returns the token representing the current state of the
+        change log (0 if nothing was logged yet)
+    """
+    from dojango.models import StoreChange
+    return StoreChange.objects.aggregate(token=Max('pk'))['token'] or 0
+
+def is_valid_token(since, token):
+    """ Returns False if the changes after the token 'since' can't be
+        reported anymore (the log was pruned or the token is unknown), so
+        the client needs a full reload.
+    """
+    from dojango.models import StoreChange
+    if since > token:
+        return False
+    first = StoreChange.objects.aggregate(first=Min('pk'))['first']
+    if first is None:
+        return since == 0
+    return since >= first - 1
+
+def get_scan_start(since):
+    """ Returns the pk after which the change log is read for the token
+        'since': the changes logged within DOJANGO_DELTA_SAFETY_WINDOW seconds
+        before the token's entry are read again (see above)
+    """
+    from dojango.models import StoreChange
+    if not since or not settings.DELTA_SAFETY_WINDOW:
+        return since
+    changed = StoreChange.objects.filter(pk=since).values_list('changed', flat=True)
+    if not changed:
+        return since
+    window_start = changed[0] - datetime.timedelta(seconds=settings.DELTA_SAFETY_WINDOW)
+    start = StoreChange.objects.filter(changed__gte=window_start, pk__lte=since) \
+        .aggregate(start=Min('pk'))['start']
+    if start is None:
+        return since
+    return start - 1
+
+def get_changes(Model, since, token):
+    """ Returns a tuple (saved, deleted) with the primary keys (as unicode)
+        of the Model instances that changed after the token 'since' (minus
+        the safety window, see get_scan_start) up to (and including) the
+        token 'token'.
+
+        Only the last change of an object counts, so an object that was
+        saved and deleted afterwards is just reported as deleted.
+    """
+    from dojango.models import StoreChange
+    changes = StoreChange.objects.filter(
+        model=_get_model_label(Model), pk__gt=get_scan_start(since), pk__lte=token
+    ).order_by('pk').values_list('object_pk', 'action')
+
+    last_actions = dict(changes)
+    saved = [ pk for pk, action in last_actions.items() if action == StoreChange.ACTION_SAVE ]
+    deleted = [ pk for pk, action in last_actions.items() if action == StoreChange.ACTION_DELETE ]
+    return saved, deleted
+
+def prune_changes(before):
+    """ Deletes all change log entries older than the datetime 'before'.
+
+        Clients holding a token from before that date have to do a full
+        reload, since deletions can't be reported to them any more.
+
+        The latest entry is always kept, so tokens keep increasing.
+    """
+    from dojango.models import StoreChange
+    StoreChange.objects.filter(changed__lt=before).exclude(pk=get_change_token()).delete()
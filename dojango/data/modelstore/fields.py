@@ -1,3 +1,10 @@
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+from django.utils.encoding import smart_str, smart_unicode
+
 import utils
 from exceptions import FieldException
 import methods
@@ -9,7 +16,8 @@ class StoreField(object):
     """ The base StoreField from which all ```StoreField```s derive
     """
 
-    def __init__(self, model_field=None, store_field=None, get_value=None, sort_field=None, can_sort=True):
+    def __init__(self, model_field=None, store_field=None, get_value=None, sort_field=None, can_sort=True,
+                 memoize=None, key=None):
         """ A StoreField corresponding to a field on a model.
 
             Arguments (all optional):
@@ -78,6 +86,25 @@ class StoreField(object):
                     Whether or not this field can be order_by()'d -- Default is True.
 
                     If this is False, then attempts to sort by this field will be ignored.
+
+                memoize
+                    Number of seconds the values of this field are cached in the Django cache.
+                    Use it for expensive values that rarely change -- the cached values of all
+                    objects of a page are fetched with a single cache.get_many() call (and the
+                    missing ones stored with cache.set_many())
+
+                    Example:
+
+                    >>> class MyStore(Store):
+                    >>>     total = StoreField(get_value=ObjectMethod('get_order_total'), memoize=60*15)
+
+                key
+                    A callable returning the cache key of an object's value (as string) if
+                    'memoize' is set.  The default key is the model and primary key of the
+                    object, use it to invalidate the value when the object changes, ie:
+
+                    >>>     total = StoreField(get_value=ObjectMethod('get_order_total'), memoize=60*15,
+                    >>>                         key=lambda obj: '%s-%s' % (obj.pk, obj.modified))
         """
 
         self._model_field_name = model_field
@@ -87,6 +114,10 @@ class StoreField(object):
         self._sort_field = sort_field
         self._get_value = get_value
 
+        # get_value is filled lazily with an ObjectMethod, so remember whether
+        # a custom one was given (see get_model_fields)
+        self._custom_get_value = get_value is not None
+
         # Attach a reference to this field to the get_value method
         # so it can access proxied_args
         if self._get_value:
@@ -95,6 +126,9 @@ class StoreField(object):
         # Proxied arguments (ie, RequestArg, ObjectArg etc.)
         self.proxied_args = {}
 
+        self.memoize = memoize
+        self._memoize_key = key
+
     def _get_sort_field(self):
         """ Return the name of the field to be passed to
             QuerySet.order_by().
@@ -129,6 +163,31 @@ class StoreField(object):
         return self._model_field_name or self._store_attr_name
     model_field_name = property(_get_model_field_name)
 
+    def get_model_fields(self):
+        """ Returns a list with the names of the model fields this field
+            reads its value from.  Used to restrict the columns fetched with
+            QuerySet.only() when a sparse fieldset is requested.
+
+            Returns None if the fields can't be known in advance (ie when a
+            custom get_value or a dotted model_field is used.)
+        """
+        if self._custom_get_value or '.' in self.model_field_name:
+            return None
+        return [self.model_field_name]
+
+    def get_memoize_key(self, obj, store):
+        """ Returns the Django cache key of the memoized value of
+            the object (see the 'memoize' and 'key' arguments)
+        """
+        if self._memoize_key is not None:
+            key = self._memoize_key(obj)
+        else:
+            key = '%s.%s' % (smart_unicode(utils.get_object_model(obj)._meta), smart_unicode(obj._get_pk_val()))
+
+        key = u'%s.%s|%s|%s' % (store.__class__.__module__, store.__class__.__name__,
+            self.store_field_name, key)
+        return 'dojango.field.' + md5(smart_str(key)).hexdigest()
+
     def get_value(self):
         """ Returns the value for this field
         """
@@ -0,0 +1,315 @@
+""" Instrumentation of servicemethod calls
+
+    JsonService sends the signal 'servicemethod_finished' after each
+    servicemethod call (only measured if the signal has receivers) with
+    these arguments:
+
+        service         The service instance (the sender is its class)
+        method_name     The name of the called servicemethod
+        wall_time       Wall clock time of the call in seconds
+        cpu_time        CPU time of the call in seconds (None if unknown)
+        query_count     Number of database queries
+        query_time      Time spent in database queries in seconds
+        request_size    Size of the Json encoded params in bytes
+        response_size   Size of the Json encoded result in bytes (None on errors)
+        exception       Name of the exception type raised by the method or None
+
+    Database queries are counted by wrapping the cursors of the thread's
+    connections for the duration of the call, so DEBUG doesn't need to be True.
+
+    The CPU time is the user + system time of the process (os.times), so it's
+    only measured if the process runs a single thread (ie prefork workers), as
+    it would include the work of concurrent requests otherwise; cpu_time is
+    None in that case.
+
+    Set DOJANGO_SERVICEMETHOD_STATS = True to aggregate the calls with the
+    built-in StatsCollector.  Each process flushes its statistics into its own
+    slot of the Django cache (claimed with the atomic cache.add), so they can
+    be read with
+
+        ./manage.py servicemethodstats
+
+    or the view dojango.views.servicemethod_stats (use a cache backend
+    shared by all processes, ie memcached)
+"""
+
+import os
+import socket
+import threading
+import time
+
+from django import VERSION as django_version
+if django_version >= (1, 5, 0):
+    import json
+else:
+    from django.utils import simplejson as json
+
+from django.core.cache import cache
+from django.db import connections
+from django.dispatch import Signal
+
+from dojango.conf import settings
+
+__all__ = ('servicemethod_finished', 'measure', 'StatsCollector',
+            'collector', 'get_stats', 'reset_stats')
+
+servicemethod_finished = Signal()
+
+def _cpu_time():
+    """ Returns the CPU time of the process or None if it runs other
+        threads, whose CPU time can't be told apart
+    """
+    if threading.active_count() == 1:
+        # user + system time of the process
+        return sum(os.times()[:2])
+    return None
+
+class _QueryCounter(object):
+    """ Counts the queries and their time
+    """
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def timed(self, func, *args):
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            self.count += 1
+            self.time += time.time() - start
+
+class _CountingCursor(object):
+    """ Wraps a cursor and passes its queries to a _QueryCounter
+    """
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def execute(self, sql, params=None):
+        return self.counter.timed(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self.counter.timed(self.cursor.executemany, sql, param_list)
+
+    # Special methods aren't looked up with __getattr__, Django uses
+    # the cursors as context managers (with connection.cursor() as ...)
+    def __enter__(self):
+        self.cursor.__enter__()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        return self.cursor.__exit__(type, value, traceback)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+def _count_queries(func, counter, *args, **kwargs):
+    """ Calls func and passes all queries it runs on this thread's
+        connections to the counter
+    """
+    # The connections are thread local, so replacing their cursor method
+    # doesn't affect other threads.  A nested call wraps the cursor of
+    # the outer call, so the queries are counted for both.
+    patched = []
+    for conn in connections.all():
+        def cursor(cursor=conn.cursor):
+            return _CountingCursor(cursor(), counter)
+        patched.append((conn, conn.__dict__.get('cursor')))
+        conn.cursor = cursor
+    try:
+        return func(*args, **kwargs)
+    finally:
+        for conn, previous in reversed(patched):
+            if previous is None:
+                del conn.cursor
+            else:
+                conn.cursor = previous
+
+def measure(func, *args, **kwargs):
+    """ Calls func and returns a tuple of its return value and a dict
+        with wall_time, cpu_time, query_count and query_time
+    """
+    counter = _QueryCounter()
+    wall_start, cpu_start = time.time(), _cpu_time()
+    ret = _count_queries(func, counter, *args, **kwargs)
+    cpu_end = _cpu_time()
+
+    cpu_time = None
+    if cpu_start is not None and cpu_end is not None:
+        cpu_time = cpu_end - cpu_start
+    return ret, {'wall_time': time.time() - wall_start, 'cpu_time': cpu_time,
+        'query_count': counter.count, 'query_time': counter.time}
+
+def get_size(data):
+    """ Returns the size of the Json encoded data or None if it can't be encoded
+    """
+    try:
+        return len(json.dumps(data))
+    except (TypeError, ValueError):
+        return None
+
+class StatsCollector(object):
+    """ Aggregates the servicemethod calls of this process (connect it to the
+        servicemethod_finished signal) and flushes them into the Django cache
+        every 'flush_interval' seconds.
+    """
+    # Upper bounds of the wall time histogram buckets in milliseconds,
+    # the last bucket holds all slower calls
+    BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    CACHE_PREFIX = 'dojango.servicemethod.stats.'
+    CACHE_TIMEOUT = 60 * 60 * 24
+    # get_stats reads the process slots in chunks of this size
+    # and stops at the first empty chunk
+    SLOT_CHUNK = 32
+
+    def __init__(self, flush_interval=10):
+        self.flush_interval = flush_interval
+        self.owner = '%s.%s' % (socket.gethostname(), os.getpid())
+        self.slot = None
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+        self.stats = {}
+
+    def _new_stats(self):
+        return {
+            'calls': 0, 'errors': {},
+            'wall_time': 0.0, 'max_wall_time': 0.0, 'cpu_time': 0.0,
+            'query_count': 0, 'query_time': 0.0,
+            'request_size': 0, 'response_size': 0,
+            'histogram': [0] * (len(self.BUCKETS) + 1),
+        }
+
+    def __call__(self, sender, method_name, wall_time, cpu_time, query_count=None,
+                 query_time=None, request_size=None, response_size=None,
+                 exception=None, **kwargs):
+        """ The signal receiver
+        """
+        ms = wall_time * 1000
+        bucket = len(self.BUCKETS)
+        for i, bound in enumerate(self.BUCKETS):
+            if ms <= bound:
+                bucket = i
+                break
+
+        self._lock.acquire()
+        try:
+            stats = self.stats.setdefault(method_name, self._new_stats())
+            stats['calls'] += 1
+            if exception:
+                stats['errors'][exception] = stats['errors'].get(exception, 0) + 1
+            stats['wall_time'] += wall_time
+            stats['max_wall_time'] = max(stats['max_wall_time'], wall_time)
+            stats['cpu_time'] += cpu_time or 0.0
+            stats['query_count'] += query_count or 0
+            stats['query_time'] += query_time or 0.0
+            stats['request_size'] += request_size or 0
+            stats['response_size'] += response_size or 0
+            stats['histogram'][bucket] += 1
+        finally:
+            self._lock.release()
+
+        if time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    @classmethod
+    def get_slot_key(cls, slot):
+        return '%sslot.%d' % (cls.CACHE_PREFIX, slot)
+
+    def flush(self):
+        """ Writes the statistics of this process into its slot of the cache
+        """
+        self._lock.acquire()
+        try:
+            snapshot = {'owner': self.owner,
+                'stats': json.loads(json.dumps(self.stats))} # a deep copy
+            self._last_flush = time.time()
+        finally:
+            self._lock.release()
+
+        if self.slot is not None:
+            current = cache.get(self.get_slot_key(self.slot))
+            if current is not None and current.get('owner') == self.owner:
+                cache.set(self.get_slot_key(self.slot), snapshot, self.CACHE_TIMEOUT)
+                return
+
+        # Claim the first free slot, cache.add is atomic so
+        # no two processes end up in the same slot
+        slot = 0
+        while not cache.add(self.get_slot_key(slot), snapshot, self.CACHE_TIMEOUT):
+            slot += 1
+        self.slot = slot
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self.stats = {}
+        finally:
+            self._lock.release()
+
+def _merge(target, stats):
+    for key in ('calls', 'wall_time', 'cpu_time', 'query_count',
+                'query_time', 'request_size', 'response_size'):
+        target[key] += stats[key]
+    target['max_wall_time'] = max(target['max_wall_time'], stats['max_wall_time'])
+    for exception, count in stats['errors'].items():
+        target['errors'][exception] = target['errors'].get(exception, 0) + count
+    target['histogram'] = [ a + b for a, b in zip(target['histogram'], stats['histogram']) ]
+
+def _get_snapshots():
+    """ Returns a dict cache key -> snapshot of all process slots
+    """
+    ret = {}
+    start = 0
+    while True:
+        keys = [ StatsCollector.get_slot_key(slot)
+            for slot in range(start, start + StatsCollector.SLOT_CHUNK) ]
+        snapshots = cache.get_many(keys)
+        if not snapshots:
+            return ret
+        ret.update(snapshots)
+        start += StatsCollector.SLOT_CHUNK
+
+def get_stats():
+    """ Returns the statistics of all processes merged into a dict
+        method name -> stats
+    """
+    if collector is not None:
+        collector.flush()
+    ret = {}
+    for snapshot in _get_snapshots().values():
+        for method_name, stats in snapshot['stats'].items():
+            if method_name not in ret:
+                ret[method_name] = StatsCollector()._new_stats()
+            _merge(ret[method_name], stats)
+    return ret
+
+def get_percentile(stats, percentile):
+    """ Estimates a wall time percentile (in milliseconds) from the
+        histogram, returns the upper bound of the matching bucket
+        (None if it's the unbounded bucket)
+    """
+    needed = stats['calls'] * percentile / 100.0
+    seen = 0
+    for i, count in enumerate(stats['histogram']):
+        seen += count
+        if count and seen >= needed:
+            return i < len(StatsCollector.BUCKETS) and StatsCollector.BUCKETS[i] or None
+    return None
+
+def reset_stats():
+    """ Drops the statistics of all processes
+    """
+    if collector is not None:
+        collector.reset()
+    for key in _get_snapshots():
+        cache.delete(key)
+
+collector = None
+if settings.SERVICEMETHOD_STATS:
+    collector = StatsCollector(settings.SERVICEMETHOD_STATS_FLUSH_INTERVAL)
+    servicemethod_finished.connect(collector, weak=False)
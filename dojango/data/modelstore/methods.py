@@ -1,6 +1,86 @@
+import threading
+import __builtin__
+
 import utils
 from exceptions import MethodException
 
+# Methods registered by name (see register_method) and
+# the cache of all resolved method names
+_registry = {}
+_resolved = {}
+_resolved_lock = threading.Lock()
+
+def register_method(name, method=None):
+    """ Registers a callable under the given name, so it can be
+        used by name in a Method (ie Method('price', ObjectArg))
+
+        Can be used as decorator as well:
+
+        >>> @register_method('price')
+        >>> def format_price(obj):
+        >>>     ...
+    """
+    def register(method):
+        _registry[name] = method
+        _resolved.pop(name, None)
+        return method
+
+    if method is None:
+        return register
+    return register(method)
+
+def _import_method(path):
+    """ Imports a callable given by its dotted path (ie 'myapp.formatters.price'
+        or 'myapp.formatters.Formatter.price')
+    """
+    parts = path.split('.')
+    for i in range(len(parts) - 1, 0, -1):
+        module_name = '.'.join(parts[:i])
+        try:
+            obj = __import__(module_name, {}, {}, [parts[i]])
+        except ImportError:
+            continue
+        try:
+            return utils.resolve_dotted_attribute(obj, '.'.join(parts[i:]))
+        except AttributeError:
+            break
+    raise MethodException('Cannot resolve method "%s"' % path)
+
+def resolve_method(name):
+    """ Resolves the name of a method into a callable, the result is cached.
+
+        The name is looked up in the registry (see register_method),
+        then in this module (ie the pre-built methods) and the builtins,
+        and finally it is imported as a dotted path (ie 'myapp.formatters.price')
+
+        Raises a MethodException if it can't be resolved.
+    """
+    try:
+        return _resolved[name]
+    except KeyError:
+        pass
+
+    if name in _registry:
+        method = _registry[name]
+    elif '.' not in name and name in globals():
+        method = globals()[name]
+    elif '.' not in name and hasattr(__builtin__, name):
+        method = getattr(__builtin__, name)
+    elif '.' in name:
+        method = _import_method(name)
+    else:
+        raise MethodException('Cannot resolve method "%s"' % name)
+
+    if not callable(method):
+        raise MethodException('Method "%s" is not callable' % name)
+
+    _resolved_lock.acquire()
+    try:
+        _resolved[name] = method
+    finally:
+        _resolved_lock.release()
+    return method
+
 class Arg(object):
     """ The base placeholder argument class
 
@@ -81,39 +161,65 @@ class BaseMethod(object):
         self.kwargs = kwargs
         self.field = None # Don't have a handle on the field yet
 
-    def __call__(self):
-        """ Builds the arguments and returns the value of the method call
+        # Precompile the arguments into slots, so they just
+        # need to be looked up when the method is called
+        self._arg_slots = [ self._compile_arg(arg) for arg in args ]
+        self._kwarg_slots = [ (key, self._compile_arg(val)) for key, val in kwargs.items() ]
+        self._is_constant = not [ slot for slot in self._arg_slots + \
+            [ slot for key, slot in self._kwarg_slots ] if slot[0] ]
+
+    def _compile_arg(self, arg):
+        """ Returns the slot of an argument: a tuple (True, <placeholder name>)
+            for placeholder args (ie RequestArg, ObjectArg etc.) or (False, arg)
+            for constant ones.
         """
+        if isinstance(arg, Arg):
+            return (True, arg.__class__.__name__)
+        if isinstance(arg, type) and issubclass(arg, Arg):
+            return (True, arg.__name__)
+        return (False, arg)
 
-        self._build_args()
-        return self.get_value()
+    def __call__(self):
+        """ Binds the arguments and returns the value of the method call
+        """
+        args, kwargs = self.bind_args()
+        return self.get_value(*args, **kwargs)
 
-    def _build_args(self):
-        """ Builds the arguments to be passed to the given method
+    def bind_args(self):
+        """ Returns the args and kwargs to be passed to the given method
 
             Substitutes placeholder args (ie RequestArg, ObjectArg etc.)
-            with the actual objects.
+            with the actual objects of the current serialization (the
+            proxied_args of the field), the method itself isn't changed.
         """
+        if self._is_constant:
+            return self.args, self.kwargs
 
-        args = []
-        for arg in self.args:
-            try:
-                arg = self.field.proxied_args.get(arg.__name__, arg)
-            except AttributeError: # No __name__ attr on the arg
-                pass
-            args.append(arg)
-        self.args = args
+        context = self.field is not None and self.field.proxied_args or {}
+
+        def bind(slot, default):
+            is_proxied, value = slot
+            if is_proxied:
+                return context.get(value, default)
+            return value
 
-        for key, val in self.kwargs.items():
-            self.kwargs.update({
-                key: self.field.proxied_args.get(hasattr(val, '__name__') and val.__name__ or val, val)
-            })
+        args = [ bind(slot, arg) for slot, arg in zip(self._arg_slots, self.args) ]
+        kwargs = dict([ (key, bind(slot, self.kwargs[key])) for key, slot in self._kwarg_slots ])
+        return args, kwargs
 
-    def get_value(self):
-        """ Calls the given method with the requested arguments.
+    def get_value(self, *args, **kwargs):
+        """ Calls the given method with the requested (bound) arguments.
         """
         raise NotImplementedError('get_value() not implemented in BaseMethod')
 
+    def validate(self):
+        """ Called when the Store class using this method is created,
+            raises a MethodException if the method is misconfigured.
+        """
+        if not callable(self.method_or_methodname) and \
+            not isinstance(self.method_or_methodname, (str, unicode) ):
+            raise MethodException('Method must a string or callable')
+
     def get_method(self, obj=None):
         """ Resolves the given method into a callable object.
 
@@ -185,10 +291,7 @@ class BaseMethod(object):
 
             return method
 
-        try:
-            return eval(self.method_or_methodname) # Just try to get it in current scope
-        except NameError:
-            raise MethodException('Cannot resolve method "%s"' % self.method_or_methodname)
+        return resolve_method(self.method_or_methodname)
 
 class Method(BaseMethod):
     """ Basic method proxy class.
@@ -206,29 +309,28 @@ class Method(BaseMethod):
 
         Notes:
 
-            If the method passed is the string name of a method,
-            it is evaluated in the global scope to get the actual
-            method, or MethodException is raised.
-
-            >>> method = Method('my_method')
+            If the method passed is the string name of a method, it is
+            looked up in the registry (see register_method) or imported by
+            its dotted path, or MethodException is raised.  That happens
+            once, when the Store class using the method is created.
 
-                Under the hood:
-                    >>> try:
-                    >>>     method = eval('my_method')
-                    >>> except NameError:
-                    >>>     ...
+            >>> method = Method('myapp.formatters.price', ObjectArg)
 
     """
-    def get_value(self):
-        return self.get_method()(*self.args, **self.kwargs)
+    def get_value(self, *args, **kwargs):
+        return self.get_method()(*args, **kwargs)
+
+    def validate(self):
+        super(Method, self).validate()
+        self.get_method()
 
 class ModelMethod(BaseMethod):
     """ A method proxy that will look for the given method
         as an attribute on the Model.
     """
-    def get_value(self):
+    def get_value(self, *args, **kwargs):
         obj = self.field.proxied_args['ModelArg']
-        return self.get_method(obj)(*self.args, **self.kwargs)
+        return self.get_method(obj)(*args, **kwargs)
 
 class ObjectMethod(BaseMethod):
     """ A method proxy that will look for the given method
@@ -245,17 +347,17 @@ class ObjectMethod(BaseMethod):
             >>> user.get_full_name()
 
     """
-    def get_value(self):
+    def get_value(self, *args, **kwargs):
         obj = self.field.proxied_args['ObjectArg']
-        return self.get_method(obj)(*self.args, **self.kwargs)
+        return self.get_method(obj)(*args, **kwargs)
 
 class StoreMethod(BaseMethod):
     """ A method proxy that will look for the given method
         as an attribute on the Store.
     """
-    def get_value(self):
+    def get_value(self, *args, **kwargs):
         obj = self.field.proxied_args['StoreArg']
-        return self.get_method(obj)(*self.args, **self.kwargs)
+        return self.get_method(obj)(*args, **kwargs)
 
 class FieldMethod(BaseMethod):
     """ A method proxy that will look for the given method
@@ -264,9 +366,9 @@ class FieldMethod(BaseMethod):
         Notes:
             Field is the field on the Store, not the Model.
     """
-    def get_value(self):
+    def get_value(self, *args, **kwargs):
         obj = self.field.proxied_args['FieldArg']
-        return self.get_method(obj)(*self.args, **self.kwargs)
+        return self.get_method(obj)(*args, **kwargs)
 
 class ValueMethod(BaseMethod):
     """ A method proxy that will look for the given method
@@ -286,14 +388,14 @@ class ValueMethod(BaseMethod):
             u'2009-10-02 12:32:12'
             >>>
     """
-    def get_value(self):
+    def get_value(self, *args, **kwargs):
         obj = self.field.proxied_args['ObjectArg']
         val = utils.resolve_dotted_attribute(obj, self.field.model_field_name)
 
         # Prevent throwing a MethodException if the value is None
         if val is None:
             return None
-        return self.get_method(val)(*self.args, **self.kwargs)
+        return self.get_method(val)(*args, **kwargs)
 
 ###
 # Pre-built custom Methods
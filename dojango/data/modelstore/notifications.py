@@ -0,0 +1,213 @@
+""" Background execution of JSON-RPC notifications
+
+    JSON-RPC 2.0 calls without an 'id' are notifications: the client
+    doesn't expect a response.  JsonService answers them immediately with
+    an empty '204 No Content' response and puts the call on the
+    notification queue, where a bounded pool of worker threads
+    (DOJANGO_JSONRPC_NOTIFICATION_WORKERS) picks them up.
+
+    The queue backend is set with DOJANGO_JSONRPC_NOTIFICATION_QUEUE
+    (a class or its dotted path, default is the in-memory MemoryQueue).
+    A backend implements put(job) and get(), ie a SQLite backed stand-in
+    for a real message queue:
+
+    class SQLiteQueue(BaseQueue):
+        def put(self, job):
+            ... # store the job, raise Full if there's no room left
+
+        def get(self):
+            ... # block until a job is available and return it
+
+    Jobs are NotificationJob instances holding plain data only (the URL path
+    the notification was sent to, the method name, the params and the id of
+    the user), so a backend can pickle them or store job.to_dict() and rebuild
+    them with NotificationJob.from_dict().  The worker looks up the service by
+    the URL path (see get_service) and calls it with a minimal request on a
+    copy of its store, so the notification doesn't share the store with other
+    requests.
+"""
+
+import threading
+try:
+    from Queue import Queue, Full
+except ImportError:
+    from queue import Queue, Full
+
+from django.conf import settings as django_settings
+try:
+    from django.urls import resolve, Resolver404
+except ImportError: # Django < 1.10
+    from django.core.urlresolvers import resolve, Resolver404
+from django.db import connection
+from django.http import HttpRequest
+
+from dojango.conf import settings
+
+__all__ = ('BaseQueue', 'MemoryQueue', 'NotificationJob', 'Full',
+            'get_notification_queue', 'queue_notification',
+            'get_service')
+
+# URL path -> service of the services that queued notifications in this process
+_services = {}
+
+def _import(path):
+    module, attr = path.rsplit('.', 1)
+    return getattr(__import__(module, {}, {}, [attr]), attr)
+
+def get_service(path):
+    """ Returns the service that answered the notification sent to the URL
+        path.  A worker in another process resolves the path with the URLconf,
+        the view has to be the service, the store or one of their methods
+        (ie store.service.view) then.
+    """
+    try:
+        return _services[path]
+    except KeyError:
+        pass
+    try:
+        view = resolve(path).func
+    except Resolver404:
+        raise ValueError('No service found for "%s"' % path)
+    obj = getattr(view, 'im_self', view) # bound methods
+    service = getattr(obj, 'service', obj)
+    if not hasattr(service, 'process_call'):
+        raise ValueError('No service found for "%s"' % path)
+    return service
+
+class BaseQueue(object):
+    """ The interface of notification queue backends
+    """
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+
+    def put(self, job):
+        """ Adds the job to the queue without blocking, raises
+            Full if the queue reached its maxsize
+        """
+        raise NotImplementedError('put not implemented in BaseQueue')
+
+    def get(self):
+        """ Removes and returns the next job, blocks until one is available
+        """
+        raise NotImplementedError('get not implemented in BaseQueue')
+
+class MemoryQueue(BaseQueue):
+    """ The default in-process notification queue
+    """
+    def __init__(self, maxsize=0):
+        super(MemoryQueue, self).__init__(maxsize)
+        self._queue = Queue(maxsize)
+
+    def put(self, job):
+        self._queue.put(job, block=False)
+
+    def get(self):
+        return self._queue.get()
+
+class NotificationJob(object):
+    """ A queued notification call
+    """
+    def __init__(self, path, method, params=None, user_id=None):
+        self.path = path
+        self.method = method
+        if params is None:
+            params = []
+        self.params = params
+        self.user_id = user_id
+
+    def to_dict(self):
+        return {'path': self.path, 'method': self.method,
+            'params': self.params, 'user_id': self.user_id}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**dict([ (str(k), v) for k, v in data.items() ]))
+
+    def get_request(self):
+        """ Returns the request passed to the servicemethod, it just carries
+            the user that sent the notification
+        """
+        request = HttpRequest()
+        request.method = 'POST'
+        if 'django.contrib.auth' in django_settings.INSTALLED_APPS:
+            from django.contrib.auth.models import AnonymousUser
+            request.user = AnonymousUser()
+            if self.user_id is not None:
+                try:
+                    from django.contrib.auth import get_user_model
+                except ImportError: # Django < 1.5
+                    from django.contrib.auth.models import User
+                else:
+                    User = get_user_model()
+                try:
+                    request.user = User.objects.get(pk=self.user_id)
+                except User.DoesNotExist:
+                    pass
+        return request
+
+    def __call__(self):
+        # The response is dropped, errors are reported through the
+        # servicemethod_finished signal (see instrumentation)
+        get_service(self.path).process_call(self.get_request(),
+            {'method': self.method, 'params': self.params}, copy_store=True)
+
+def _get_queue_class():
+    queue_class = settings.JSONRPC_NOTIFICATION_QUEUE
+    if isinstance(queue_class, basestring):
+        queue_class = _import(queue_class)
+    return queue_class
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def _worker(queue):
+    while True:
+        job = queue.get()
+        try:
+            job()
+        except Exception:
+            pass # There's no one to report to
+        finally:
+            # Each worker thread has its own database connection
+            connection.close()
+
+def get_notification_queue():
+    """ Returns the notification queue of the process, the worker
+        threads are started on the first call
+    """
+    global _queue
+    if _queue is None:
+        _queue_lock.acquire()
+        try:
+            if _queue is None:
+                queue = _get_queue_class()(settings.JSONRPC_NOTIFICATION_QUEUE_SIZE)
+                for i in range(settings.JSONRPC_NOTIFICATION_WORKERS):
+                    worker = threading.Thread(target=_worker, args=(queue,),
+                        name='dojango-notification-worker-%d' % i)
+                    worker.daemon = True
+                    worker.start()
+                _queue = queue
+        finally:
+            _queue_lock.release()
+    return _queue
+
+def queue_notification(service, request, data):
+    """ Queues the notification call 'data' of the service.  If the queue
+        is full the call is executed right away, so the client is slowed
+        down instead of losing the call.
+    """
+    # The same Store class can be mounted at several URLs (with different
+    # objects or services), so the service is identified by the URL
+    path = request.path
+    _services[path] = service
+
+    user = getattr(request, 'user', None)
+    user_id = None
+    if user is not None and user.is_authenticated():
+        user_id = user.pk
+
+    job = NotificationJob(path, data.get('method'), data.get('params'), user_id)
+    try:
+        get_notification_queue().put(job)
+    except Full:
+        job()
@@ -1,12 +1,43 @@
-import sys, inspect
+import copy, sys, inspect, threading, types, uuid
+from multiprocessing.pool import ThreadPool
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
 
 from django import VERSION as django_version
 if django_version >= (1, 5, 0):
     import json
 else:
     from django.utils import simplejson as json
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import signals
+from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified
+
+from dojango.conf import settings
+from dojango.util import is_msgpack_request, msgpack_decode, to_negotiated_response
 
 from exceptions import ServiceException
+from instrumentation import servicemethod_finished, measure, get_size
+from notifications import queue_notification
+
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+def get_batch_pool():
+    """ Returns the thread pool (shared by all services of the process)
+        used to execute the calls of batch requests concurrently
+    """
+    global _batch_pool
+    if _batch_pool is None:
+        _batch_pool_lock.acquire()
+        try:
+            if _batch_pool is None:
+                _batch_pool = ThreadPool(settings.JSONRPC_BATCH_MAX_WORKERS)
+        finally:
+            _batch_pool_lock.release()
+    return _batch_pool
 
 def servicemethod(*args, **kwargs):
     """ The Service method decorator.
@@ -41,9 +72,38 @@ def servicemethod(*args, **kwargs):
             If only one is True then that one will be passed first.  This is useful for using
             standard Django view functions as servicemethods since they require the 'request'
             as the first argument.
+
+            cache (optional):
+                Number of seconds the results are cached in the Django cache, keyed by the
+                method and its (JSON normalized) params.  Only use it for methods without
+                side effects.  (Default is None, no caching)
+
+            vary_on_user (optional):
+                Cache the results per user (request.user).  (Default is False)
+
+            depends_on (optional):
+                A list of Model classes -- saving or deleting an instance of one of them
+                drops all cached results of the method.  (See invalidate_servicemethod)
+
+            idempotent (optional):
+                The method has no side effects and can also be called with a GET request
+                (?method=<name>&params=<canonical Json params>), which can be cached by
+                browsers and proxies.  (Default is False)
+
+            max_age (optional):
+                Number of seconds the GET responses of an idempotent method may be cached
+                by the clients.  (Default is DOJANGO_SERVICEMETHOD_MAX_AGE)
+
+            public (optional):
+                The GET responses of an idempotent method are the same for all users
+                and may be cached by shared caches (Cache-Control: public).  Otherwise
+                they are private and vary on the Cookie.  Ignored if vary_on_user is
+                True.  (Default is False)
     """
     # Default options
-    options = {'name': None, 'store': None, 'request_arg': True, 'store_arg': True}
+    options = {'name': None, 'store': None, 'request_arg': True, 'store_arg': True,
+        'cache': None, 'vary_on_user': False, 'depends_on': (),
+        'idempotent': False, 'max_age': None, 'public': False}
 
     # Figure out if we were called with arguments
     # If we were called with args, ie:
@@ -63,6 +123,12 @@ def servicemethod(*args, **kwargs):
             'store': (len(args) >= 2) and args[1] or kwargs.pop('store', None),
             'request_arg': kwargs.pop('request_arg', True),
             'store_arg': kwargs.pop('store_arg', True),
+            'cache': kwargs.pop('cache', None),
+            'vary_on_user': kwargs.pop('vary_on_user', False),
+            'depends_on': kwargs.pop('depends_on', ()),
+            'idempotent': kwargs.pop('idempotent', False),
+            'max_age': kwargs.pop('max_age', None),
+            'public': kwargs.pop('public', False),
         })
     else:
         options['name'] = method.__name__
@@ -78,10 +144,96 @@ def servicemethod(*args, **kwargs):
         if options['store'] is not None:
             options['store'].service.add_method(method)
 
+        for Model in options['depends_on']:
+            _invalidate_on_change(method, Model)
+
         return method
 
     return method or method_with_args_wrapper
 
+def copy_servicemethod(method):
+    """ Returns a copy of a servicemethod function with its own options,
+        so a servicemethod inherited by several Stores (ie ModelQueryStore.fetch)
+        can be bound to each of them
+    """
+    clone = types.FunctionType(method.func_code, method.func_globals,
+        method.func_name, method.func_defaults, method.func_closure)
+    clone.__dict__.update(method.__dict__)
+    clone.__doc__ = method.__doc__
+    clone.__module__ = method.__module__
+    clone.__servicemethod__ = dict(method.__servicemethod__)
+    return clone
+
+RESULT_CACHE_PREFIX = 'dojango.servicemethod.'
+
+def _get_method_path(method):
+    return '%s.%s' % (method.__module__, method.__name__)
+
+def _get_store_path(method):
+    store = method.__servicemethod__.get('store')
+    if store is None:
+        return None
+    return '%s.%s' % (store.__class__.__module__, store.__class__.__name__)
+
+def _get_generation_key(method):
+    return RESULT_CACHE_PREFIX + 'generation.' + md5(_get_method_path(method)).hexdigest()
+
+def canonical_json(params):
+    """ Encodes the params as Json with sorted keys and without whitespace,
+        so equal params always result in the same string (ie the same
+        cache key or GET url)
+    """
+    return json.dumps(params, sort_keys=True, separators=(',', ':'))
+
+def get_result_cache_key(method, params, request=None):
+    """ Returns the cache key of a servicemethod result for the given params
+        (and the user of the request if the method varies on the user).
+
+        The class of the Store the method is bound to is part of the key, as
+        the same (inherited) servicemethod returns different results per Store.
+    """
+    generation_key = _get_generation_key(method)
+    generation = cache.get(generation_key)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        cache.set(generation_key, generation)
+
+    user = None
+    if method.__servicemethod__.get('vary_on_user') and request is not None:
+        user = getattr(request, 'user', None)
+        user = user is not None and user.is_authenticated() and user.pk or None
+
+    key = '%s|%s|%s|%s|%s|%s' % (
+        _get_method_path(method), _get_store_path(method), method.__servicemethod__['name'],
+        generation, user, canonical_json(params)
+    )
+    return RESULT_CACHE_PREFIX + md5(key).hexdigest()
+
+def invalidate_servicemethod(method, params=None, request=None):
+    """ Drops the cached results of a servicemethod (see the 'cache' option
+        of the servicemethod decorator).
+
+        If params are given, just the result for these params (and the
+        user of the given request) is dropped.  As results are cached per
+        Store, pass the method bound to the Store in that case, ie
+        MyStore().service.get_method('fetch').
+    """
+    if params is None:
+        cache.set(_get_generation_key(method), uuid.uuid4().hex)
+    else:
+        cache.delete(get_result_cache_key(method, params, request))
+
+def _invalidate_on_change(method, Model):
+    """ Drops the cached results of the method when
+        an instance of the Model is saved or deleted
+    """
+    def invalidate(sender, **kwargs):
+        invalidate_servicemethod(method)
+
+    uid = 'dojango_servicemethod_%s_%s' % (_get_method_path(method), Model._meta)
+    signals.post_save.connect(invalidate, sender=Model, weak=False, dispatch_uid=uid + '_save')
+    signals.post_delete.connect(invalidate, sender=Model, weak=False, dispatch_uid=uid + '_delete')
+
 class BaseService(object):
     """ The base Service class that manages servicemethods and
         service method descriptions
@@ -91,6 +243,18 @@ class BaseService(object):
         """
         self.methods = {}
         self._store = None
+        self._smd_methods = None # see get_smd_methods
+
+    def __copy__(self):
+        """ Returns a copy of the service without servicemethods,
+            which can be bound to another store
+        """
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        clone.methods = {}
+        clone._store = None
+        clone._smd_methods = None
+        return clone
 
     def _get_store(self):
         """ Property getter for the store this service is
@@ -109,14 +273,18 @@ class BaseService(object):
         self._store = store
     store = property(_get_store, _set_store)
 
-    def _get_method_args(self, method, request, params):
+    def _get_method_args(self, method, request, params, copy_store=False):
         """ Decide if we should pass store_arg and/or request_arg
-            to the servicemethod
+            to the servicemethod (with copy_store the method gets its
+            own copy of the store)
         """
         idx = 0
 
         if method.__servicemethod__['store_arg']:
-            params.insert(idx, method.__servicemethod__['store'])
+            store = method.__servicemethod__['store']
+            if copy_store and store is not None:
+                store = copy.copy(store)
+            params.insert(idx, store)
             idx += 1
 
         if method.__servicemethod__['request_arg']:
@@ -135,7 +303,15 @@ class BaseService(object):
                 'request_arg': request_arg, 'store_arg': store_arg}
 
         method.__servicemethod__ = options
-        self.methods[ options['name'] ] = method
+        self.set_method(options['name'], method)
+
+    def set_method(self, name, method):
+        """ Registers the servicemethod under the given name and
+            invalidates the precomputed method descriptions
+        """
+        if self.methods.get(name) is not method:
+            self.methods[name] = method
+            self._smd_methods = None
 
     def get_method(self, name):
         """ Returns the servicemethod given by name
@@ -173,6 +349,20 @@ class BaseService(object):
         """
         raise NotImplementedError('get_smd not implemented in BaseService')
 
+    def describe_method(self, name, method):
+        """ Returns the description of a single servicemethod for the SMD
+        """
+        raise NotImplementedError('describe_method not implemented in BaseService')
+
+    def get_smd_methods(self):
+        """ Returns the descriptions of all servicemethods, they are
+            computed once and cached until a method is added
+        """
+        if self._smd_methods is None:
+            self._smd_methods = [ self.describe_method(name, method) \
+                for name, method in self.methods.items() ]
+        return self._smd_methods
+
 class JsonService(BaseService):
     """ Implements a JSON-RPC version 1.1 service
     """
@@ -181,46 +371,222 @@ class JsonService(BaseService):
         """ JSON-RPC method calls come in as POSTs
             --
             Requests for the SMD come in as GETs
+            --
+            Idempotent servicemethods can be called with GETs as well
+            (see process_get)
+
+            Returns the response as Json string (an empty one if the
+            request just holds notifications), use view() to get an
+            HttpResponse.
         """
 
         if request.method == 'POST':
             response = self.process_request(request)
+            if response is None:
+                return ''
+
+        elif 'method' in request.GET:
+            response = self.process_get(request)
 
         else:
             response = self.get_smd(request.get_full_path())
 
         return json.dumps(response)
 
+    def view(self, request):
+        """ The service as Django view, it always returns an HttpResponse:
+
+            - clients sending 'Accept: application/msgpack' get a MessagePack
+              encoded response
+            - requests with just notifications get an empty '204 No Content'
+            - GET calls of idempotent servicemethods get caching headers and
+              are answered with '304 Not Modified' if the client has the result
+              already (see get_cacheable_response)
+
+            >>> url(r'^myservice/$', my_service.view)
+        """
+        if request.method == 'POST':
+            response = self.process_request(request)
+            if response is None:
+                return HttpResponse(status=204)
+            return to_negotiated_response(response, request)
+
+        if 'method' in request.GET:
+            method = self.methods.get(request.GET['method'])
+            if method is not None and not method.__servicemethod__.get('idempotent'):
+                return HttpResponseNotAllowed(['POST'])
+            return self.get_cacheable_response(request, method, self.process_get(request))
+
+        return to_negotiated_response(self.get_smd(request.get_full_path()), request)
+
     def process_request(self, request):
         """ Handle the request
+
+            A list of calls (a batch request) is answered with
+            a list of responses.
+
+            Notifications (JSON-RPC 2.0 calls without an 'id') are
+            executed in the background (see notifications) and don't
+            get a response -- None is returned if there's nothing
+            to answer.
         """
         try:
-            data = json.loads(request.raw_post_data)
-            id, method_name, params = data["id"], data["method"], data["params"]
+            if is_msgpack_request(request):
+                data = msgpack_decode(request.body)
+            else:
+                data = json.loads(request.body)
 
         # Doing a blanket except here because God knows kind of crazy
         # POST data might come in.
         except:
             return self.process_error(0, 100, 'Invalid JSON-RPC request')
 
+        if isinstance(data, list):
+            return self.process_batch(request, data)
+        if self.is_notification(data):
+            queue_notification(self, request, data)
+            return None
+        return self.process_call(request, data)
+
+    def process_get(self, request):
+        """ Handle a call of an idempotent servicemethod sent as GET
+            request: ?method=<name>&params=<Json encoded list of params>
+            (the client should use canonical_json to encode the params, so
+            caches see the same url for the same call)
+        """
+        method_name = request.GET['method']
+        method = self.methods.get(method_name)
+        if method is not None and not method.__servicemethod__.get('idempotent'):
+            return self.process_error(None, 100, 'Method "%s" can only be called with POST' % method_name)
+
+        try:
+            params = json.loads(request.GET.get('params', '[]'))
+        except ValueError:
+            params = None
+
+        if not isinstance(params, list):
+            return self.process_error(None, 100, 'Invalid JSON-RPC request')
+        return self.process_call(request, {'id': None, 'method': method_name, 'params': params})
+
+    def get_cacheable_response(self, request, method, response):
+        """ Returns the HttpResponse of a GET call (see process_get).
+
+            Successful responses get an ETag and Cache-Control header
+            (see the 'max_age' and 'public' options of the servicemethod
+            decorator), conditional requests are answered with '304 Not Modified'.
+        """
+        http_response = to_negotiated_response(response, request)
+        if response.get('error'):
+            http_response['Cache-Control'] = 'no-cache'
+            return http_response
+
+        etag = '"%s"' % md5(http_response.content).hexdigest()
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            http_response = HttpResponseNotModified()
+
+        options = method.__servicemethod__
+        max_age = options.get('max_age')
+        if max_age is None:
+            max_age = settings.SERVICEMETHOD_MAX_AGE
+        http_response['ETag'] = etag
+        if options.get('public') and not options.get('vary_on_user'):
+            http_response['Cache-Control'] = 'public, max-age=%d' % max_age
+            http_response['Vary'] = 'Accept'
+        else:
+            http_response['Cache-Control'] = 'private, max-age=%d' % max_age
+            http_response['Vary'] = 'Accept, Cookie'
+        return http_response
+
+    def is_notification(self, data):
+        """ True/False whether the call is a notification
+        """
+        return isinstance(data, dict) and 'id' not in data
+
+    def process_batch(self, request, calls):
+        """ Handle a batch request, the calls are executed
+            concurrently on a thread pool if the setting
+            DOJANGO_JSONRPC_BATCH_PARALLEL is True.  Each of these
+            calls works on its own copy of the store, since
+            serializing a store changes its state.
+        """
+        if not calls:
+            return self.process_error(0, 100, 'Invalid JSON-RPC request: empty batch')
+
+        for call in calls:
+            if self.is_notification(call):
+                queue_notification(self, request, call)
+        calls = [ call for call in calls if not self.is_notification(call) ]
+        if not calls:
+            return None
+
+        if not settings.JSONRPC_BATCH_PARALLEL or len(calls) == 1:
+            return [ self.process_call(request, call) for call in calls ]
+
+        def process_call(call):
+            try:
+                return self.process_call(request, call, copy_store=True)
+            finally:
+                # Each worker thread has its own database connection
+                connection.close()
+
+        return get_batch_pool().map(process_call, calls)
+
+    def process_call(self, request, data, copy_store=False):
+        """ Handle a single call of the request
+            (see call_method for copy_store)
+        """
+        try:
+            id, method_name, params = data.get("id"), data["method"], data.get("params", [])
+        except:
+            return self.process_error(0, 100, 'Invalid JSON-RPC request')
+
         try:
             method = self.get_method(method_name)
         except ServiceException:
             return self.process_error(id, 100, 'Unknown method: "%s"' % method_name)
 
-        params = self._get_method_args(method, request, params)
+        if not servicemethod_finished.receivers:
+            return self.call_method(request, id, method, params, copy_store)[0]
+
+        request_size = get_size(params)
+        (response, exception), stats = measure(self.call_method, request, id, method, params, copy_store)
+        servicemethod_finished.send(sender=self.__class__, service=self,
+            method_name=method_name, exception=exception, request_size=request_size,
+            response_size=exception is None and get_size(response.get('result')) or None,
+            **stats)
+        return response
+
+    def call_method(self, request, id, method, params, copy_store=False):
+        """ Calls the servicemethod (or takes the result from the cache),
+            passing it a copy of its store if copy_store is True (for calls
+            that run concurrently with others)
+
+            Returns a tuple of the response and the name of the
+            exception type raised by the method (or None)
+        """
+        timeout = method.__servicemethod__.get('cache')
+        if timeout:
+            cache_key = get_result_cache_key(method, params, request)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return self.process_response(id, cached[0]), None
+
+        params = self._get_method_args(method, request, params, copy_store)
 
         try:
             result = method(*params)
-            return self.process_response(id, result)
+            if timeout:
+                # Wrapped, so a result of None can be cached as well
+                cache.set(cache_key, (result,), timeout)
+            return self.process_response(id, result), None
 
         except BaseException:
             etype, eval, etb = sys.exc_info()
-            return self.process_error(id, 100, '%s: %s' % (etype.__name__, eval) )
+            return self.process_error(id, 100, '%s: %s' % (etype.__name__, eval) ), etype.__name__
 
         except:
             etype, eval, etb = sys.exc_info()
-            return self.process_error(id, 100, 'Exception %s: %s' % (etype, eval) )
+            return self.process_error(id, 100, 'Exception %s: %s' % (etype, eval) ), str(etype)
 
     def process_response(self, id, result):
         """ Build a JSON-RPC 1.1 response dict
@@ -248,25 +614,28 @@ class JsonService(BaseService):
     def get_smd(self, url):
         """ Generate a JSON-RPC 1.1 Service Method Description (SMD)
         """
-        smd = {
+        return {
             'serviceType': 'JSON-RPC',
             'serviceURL': url,
-            'methods': []
+            'methods': self.get_smd_methods()
         }
 
-        for name, method in self.methods.items():
-
-            # Figure out what params to report --
-            # we don't want to report the 'store' and 'request'
-            # params to the remote method.
-            idx = 0
-            idx += method.__servicemethod__['store_arg'] and 1 or 0
-            idx += method.__servicemethod__['request_arg'] and 1 or 0
-
-            sig = inspect.getargspec(method)
-            smd['methods'].append({
-                'name': name,
-                'parameters': [ {'name': val} for val in sig.args[idx:] ]
-            })
+    def describe_method(self, name, method):
+        """ Describe a servicemethod and its parameters
+        """
+        # Figure out what params to report --
+        # we don't want to report the 'store' and 'request'
+        # params to the remote method.
+        idx = 0
+        idx += method.__servicemethod__['store_arg'] and 1 or 0
+        idx += method.__servicemethod__['request_arg'] and 1 or 0
 
-        return smd
+        sig = inspect.getargspec(method)
+        description = {
+            'name': name,
+            'parameters': [ {'name': val} for val in sig.args[idx:] ]
+        }
+        # Idempotent methods can be called with GET requests (see process_get)
+        if method.__servicemethod__.get('idempotent'):
+            description['transport'] = 'GET'
+        return description
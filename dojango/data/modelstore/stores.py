@@ -4,12 +4,26 @@ if django_version >= (1, 5, 0):
 else:
     from django.utils import simplejson as json
 
+import copy
+
 from django.utils.encoding import smart_unicode
 from django.core.paginator import Paginator
+from django.http import HttpResponse, HttpResponseNotModified
+from django.core.cache import cache
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+from dojango.conf import settings
 
-from utils import get_fields_and_servicemethods
+from dojango.util import to_columnar, to_negotiated_response
+
+from utils import get_fields_and_servicemethods, get_identifier_prefix, get_object_model
+import delta
 from exceptions import StoreException, ServiceException
-from services import JsonService, servicemethod
+from methods import BaseMethod
+from services import JsonService, servicemethod, copy_servicemethod
 
 __all__ = ('Store', 'ModelQueryStore')
 
@@ -25,9 +39,12 @@ class StoreMetaclass(type):
         attrs['servicemethods'] = servicemethods
 
         # Tell each field the name of the attribute used to reference it
-        # in the Store
+        # in the Store, and check its method proxy (so a misconfigured
+        # method fails here instead of on each serialized object)
         for fieldname, field in fields.items():
             setattr(field, '_store_attr_name', fieldname)
+            if isinstance(field._get_value, BaseMethod):
+                field._get_value.validate()
         attrs['fields'] = fields
 
         return super(StoreMetaclass, cls).__new__(cls, name, bases, attrs)
@@ -41,10 +58,30 @@ class BaseStore(object):
 
             Same basic concept as Django's Meta class
             on Model definitions.
+
+            Besides the constructor arguments it takes the options:
+
+                service:
+                    The service (ie JsonService()) exposing the servicemethods.
+
+                embed_smd:
+                    Whether the SMD of the service is embedded into the store data
+                    (the default) or just fetched by the client with /store/url/?smd
+
+                compact_identifiers:
+                    Use the short codes registered with utils.register_identifier_code
+                    in the item identifiers (ie 'p__42' instead of 'shop.product__42').
+                    Default is False.
+
+                label_fields:
+                    The names of the model fields get_label() reads (ie ['name'] if
+                    the label is the model's __unicode__ returning the name).  A label
+                    that isn't a declared field can only be combined with
+                    QuerySet.only() for sparse fieldsets if they are given.
         """
         pass
 
-    def __init__(self, objects=None, stores=None, identifier=None, label=None, is_nested=False):
+    def __init__(self, objects=None, stores=None, identifier=None, label=None, is_nested=False, fields=None):
         """ Store instance constructor.
 
             Arguments (all optional):
@@ -71,6 +108,10 @@ class BaseStore(object):
                     {'identifier': "id", 'label', ...}
                     It mainly is required, if children of a tree structure needs
                     to be rendered (see TreeStore).
+
+                fields:
+                    A list of store field names (a sparse fieldset) the serialization
+                    is restricted to.  All declared fields are serialized if omitted.
         """
 
         # Instantiate the inner Meta class
@@ -100,6 +141,23 @@ class BaseStore(object):
         elif not self.has_option('objects'):
             self.set_option('objects', [])
 
+        # Embed the SMD into the store data?
+        if not self.has_option('embed_smd'):
+            self.set_option('embed_smd', True)
+
+        # Use the compact identifier codes?
+        if not self.has_option('compact_identifiers'):
+            self.set_option('compact_identifiers', False)
+
+        # Set the sparse fieldset
+        if fields is not None:
+            self.set_option('fieldset', fields)
+        elif not self.has_option('fieldset'):
+            self.set_option('fieldset', None)
+
+        # The fieldset of the current serialization (see to_python)
+        self._fieldset = self.get_option('fieldset')
+
         # Set the stores
         if stores:
             self.set_option('stores', stores)
@@ -111,18 +169,42 @@ class BaseStore(object):
 
         # Do we have service set?
         try:
-            self.service = self.get_option('service')
-            self.service.store = self
-
-            # Populate all the declared servicemethods
+            # Each store gets its own copy of the service, so stores of the
+            # same class (ie mounted at several URLs with other objects)
+            # aren't bound to the same service
+            self.service = copy.copy(self.get_option('service'))
+            self.set_option('service', self.service)
+
+            # Populate all the declared servicemethods, the functions are
+            # shared by all Stores declaring or inheriting them, so each
+            # store binds its own copy
             for method in self.servicemethods.values():
-                self.service.add_method(method)
+                self.service.add_method(copy_servicemethod(method))
+
+            # Bind the service (and the store reference of all its methods)
+            # after the methods were added
+            self.service.store = self
 
         except StoreException:
             self.service = None
 
+        self._servicemethods_merged = False
         self.request = None # Placeholder for the Request object (if used)
         self.data = self.is_nested and [] or {} # The serialized data in it's final form
+        self._memoized_keys = None # The cache keys of memoized field values (see _start_memoization)
+
+    def __copy__(self):
+        """ Returns a copy of the store with its own options, combined stores
+            and serialization state, which can serialize concurrently with
+            this store (ie in the calls of a parallel batch request)
+        """
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        clone._meta = copy.copy(self._meta)
+        clone.set_option('stores', [ copy.copy(store) for store in self.get_option('stores') ])
+        clone.data = self.is_nested and [] or {}
+        clone._item = None
+        return clone
 
     def has_option(self, option):
         """ True/False whether the given option is set in the store
@@ -154,19 +236,65 @@ class BaseStore(object):
             It accepts the Request object as it's only param, which
             it makes available to other methods at 'self.request'.
 
-            Returns the serialized store as Json.
+            Returns the serialized store as Json (or the Json response of
+            the store's service for POSTs, GET calls of idempotent
+            servicemethods (ie /my/store/?method=...) and the SMD
+            (ie /my/store/?smd)).  Use view() to get an HttpResponse.
         """
         self.request = request
 
         if self.service:
-            self._merge_servicemethods()
-            if not self.is_nested:
-                self.data['SMD'] = self.service.get_smd( request.get_full_path() )
+            if not self._servicemethods_merged:
+                self._merge_servicemethods()
 
-            if request.method == 'POST':
+            if request.method == 'POST' or 'method' in request.GET:
                 return self.service(request)
 
-        return self.to_json()
+            if 'smd' in request.GET:
+                return json.dumps( self.service.get_smd(request.path) )
+
+        return json.dumps( self.get_response_data(request) )
+
+    def view(self, request):
+        """ The store as Django view, it always returns an HttpResponse.
+
+            Just like __call__, but the responses are MessagePack encoded
+            if the client sent 'Accept: application/msgpack' (and the msgpack
+            package is installed), the SMD can be cached by the client and the
+            service calls get the HttpResponses of JsonService.view.
+
+            >>> url(r'^mystore/$', MyStore().view)
+        """
+        self.request = request
+
+        if self.service:
+            if not self._servicemethods_merged:
+                self._merge_servicemethods()
+
+            if request.method == 'POST' or 'method' in request.GET:
+                return self.service.view(request)
+
+            if 'smd' in request.GET:
+                return self.get_smd_response(request)
+
+        return to_negotiated_response(self.get_response_data(request), request)
+
+    def get_response_data(self, request):
+        """ Returns the data answering a GET request of the store: the
+            serialized store (with the sparse fieldset and in the format
+            requested by the client) or its changes since the 'since' token.
+        """
+        if self.service and not self.is_nested and self.get_option('embed_smd'):
+            self.data['SMD'] = self.service.get_smd( request.get_full_path() )
+
+        fields = self.get_request_fieldset(request)
+        if 'since' in request.GET:
+            try:
+                since = int(request.GET['since'])
+            except ValueError:
+                since = None # An invalid token forces a full reload
+            return self.to_delta(since, fields=fields)
+        return self.to_python(fields=fields, columnar=self.is_columnar_request(request))
 
     def __str__(self):
         """ Renders the store as Json.
@@ -180,14 +308,99 @@ class BaseStore(object):
         return '<%s: identifier: %s, label: %s, objects: %d>' % (
             self.__class__.__name__, self.get_option('identifier'), self.get_option('label'), count)
 
+    def get_smd_response(self, request):
+        """ Returns the SMD of the store's service as HttpResponse that
+            can be cached by the client (DOJANGO_SMD_MAX_AGE seconds)
+        """
+        smd = json.dumps( self.service.get_smd(request.path) )
+        etag = '"%s"' % md5(smd).hexdigest()
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            return HttpResponseNotModified()
+
+        response = HttpResponse(smd, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, max-age=%d' % settings.SMD_MAX_AGE
+        return response
+
+    def get_request_fieldset(self, request):
+        """ Returns the sparse fieldset requested by the client with
+            the 'fields' parameter (ie ?fields=id,label), or None
+        """
+        fieldset = request.GET.get('fields', None)
+        if not fieldset:
+            return None
+        return [ name.strip() for name in fieldset.split(',') if name.strip() ]
+
+    def is_columnar_request(self, request):
+        """ True/False whether the client asked for the compact columnar
+            format with the 'format=columnar' parameter
+        """
+        return request.GET.get('format', None) == 'columnar'
+
+    def get_fieldset(self):
+        """ Returns the StoreFields that will be serialized, taking
+            the sparse fieldset (if any) into account.
+        """
+        fields = self.get_option('fields').values()
+        if not self._fieldset:
+            return fields
+        return [ field for field in fields if field.store_field_name in self._fieldset ]
+
+    def has_computed_label(self):
+        """ True/False whether the items get a label from get_label()
+            (a label that isn't a declared field and, with a sparse
+            fieldset, is part of it)
+        """
+        label = self.get_option('label')
+        if not label or label in self.get_option('fields').keys():
+            return False
+        return not self._fieldset or label in self._fieldset
+
+    def restrict_objects(self, objects):
+        """ Calls QuerySet.only() with the model fields backing the
+            sparse fieldset, so unused columns are never fetched.
+
+            The objects are returned untouched if no fieldset is set, they
+            aren't a QuerySet or any of the serialized values might read
+            a column that is not known in advance.
+        """
+        if not self._fieldset or not hasattr(objects, 'only'):
+            return objects
+
+        opts = objects.model._meta
+        concrete = [ f.name for f in opts.fields ]
+        many_to_many = [ f.name for f in opts.many_to_many ]
+
+        names = []
+        for field in self.get_fieldset():
+            field_names = field.get_model_fields()
+            if field_names is None:
+                return objects
+            names += field_names
+
+        # get_label() may read any attribute of the object,
+        # unless the 'label_fields' option tells which ones
+        if self.has_computed_label():
+            if not self.has_option('label_fields'):
+                return objects
+            names += list(self.get_option('label_fields'))
+
+        only = []
+        for name in names:
+            if name in concrete:
+                only.append(name)
+            elif name not in many_to_many: # m2m values are never deferred
+                return objects
+
+        return objects.only(*only)
+
     def get_identifier(self, obj):
         """ Returns a (theoretically) unique key for a given
             object of the form: <appname>.<modelname>__<pk>
+            (or <code>__<pk> with the 'compact_identifiers' option)
         """
-        return smart_unicode('%s__%s' % (
-            obj._meta,
-            obj._get_pk_val(),
-        ), strings_only=True)
+        return get_identifier_prefix(get_object_model(obj), self._meta.compact_identifiers) + \
+            smart_unicode(obj._get_pk_val())
 
     def get_label(self, obj):
         """ Calls the object's __unicode__ method
@@ -213,31 +426,37 @@ class BaseStore(object):
 
                 for name, method in store.service.methods.items():
                     try:
-                        self.service.get_method(name)
+                        if self.service.get_method(name) is method: # Already merged
+                            continue
                         raise StoreException('Combined stores have conflicting service method name "%s"' % name)
                     except ServiceException: # This is what we want
 
                         # Don't use service.add_method since we want the 'foreign' method to
                         # stay attached to the original store
-                        self.service.methods[name] = method
+                        self.service.set_method(name, method)
+
+            self._servicemethods_merged = True
 
     def _merge_stores(self):
         """ Merge all the stores into one.
         """
         for store in self.get_option('stores'):
 
-            # The other stores will (temporarily) take on this store's 'identifier' and
-            # 'label' settings
-            orig_identifier = store.get_option('identifier')
-            orig_label = store.get_option('label')
-            for attr in ('identifier', 'label'):
+            # The other stores will (temporarily) take on this store's 'identifier',
+            # 'label' and 'compact_identifiers' settings, so the merged items
+            # reference each other with the same identifiers
+            attrs = ('identifier', 'label', 'compact_identifiers')
+            orig = dict([ (attr, store.get_option(attr)) for attr in attrs ])
+            for attr in attrs:
                 store.set_option(attr, self.get_option(attr))
 
-            self.data['items'] += store.to_python()['items']
-
-            # Reset the old values for label and identifier
-            store.set_option('identifier', orig_identifier)
-            store.set_option('label', orig_label)
+            try:
+                # Combined stores get the same sparse fieldset
+                self.data['items'] += store.to_python(fields=self._fieldset)['items']
+            finally:
+                # Reset the old values
+                for attr in attrs:
+                    store.set_option(attr, orig[attr])
 
     def add_store(self, *stores):
         """ Add one or more stores to this store.
@@ -255,8 +474,9 @@ class BaseStore(object):
         # If a non-instance Store is given, instantiate it.
         stores = [ isinstance(s, Store) and s or s() for s in stores ]
         self.set_option('stores', list( self.get_option('stores') ) + stores )
+        self._servicemethods_merged = False
 
-    def to_python(self, objects=None):
+    def to_python(self, objects=None, fields=None, columnar=False):
         """ Serialize the store into a Python dictionary.
 
             Arguments (optional):
@@ -265,17 +485,35 @@ class BaseStore(object):
                     The list (or any iterable, ie QuerySet) of objects that will
                     fill the store -- the previous 'objects' setting will be restored
                     after serialization is finished.
+
+                fields:
+                    A sparse fieldset (list of store field names) to restrict the
+                    serialization to, instead of the 'fieldset' option (which
+                    isn't changed).
+
+                columnar:
+                    Return the data in the compact columnar format (see
+                    dojango.util.to_columnar) -- ignored for nested stores.
         """
+        # Save the previous settings
+        old_objects = self.get_option('objects')
+        old_fieldset = self._fieldset
 
         if objects is not None:
-            # Save the previous objects setting
-            old_objects = self.get_option('objects')
             self.set_option('objects', objects)
-            self._serialize()
-            self.set_option('objects', old_objects)
+        if fields is not None:
+            self._fieldset = fields
         else:
+            self._fieldset = self.get_option('fieldset')
+
+        try:
             self._serialize()
+        finally:
+            self.set_option('objects', old_objects)
+            self._fieldset = old_fieldset
 
+        if columnar and not self.is_nested:
+            return to_columnar(self.data)
         return self.data
 
     def to_json(self, *args, **kwargs):
@@ -288,10 +526,82 @@ class BaseStore(object):
                     The list (or any iterable, ie QuerySet) of objects that will
                     fill the store.
 
+                fields:
+                    (The kwarg 'fields')
+                    A sparse fieldset to restrict the serialization to.
+
+                columnar:
+                    (The kwarg 'columnar')
+                    Serialize the store in the compact columnar format.
+
                 All other args and kwargs are passed to json.dumps
         """
         objects = kwargs.pop('objects', None)
-        return json.dumps( self.to_python(objects), *args, **kwargs )
+        fields = kwargs.pop('fields', None)
+        columnar = kwargs.pop('columnar', False)
+        return json.dumps( self.to_python(objects, fields, columnar), *args, **kwargs )
+
+    def get_changed_objects(self, since, token):
+        """ Returns a tuple (objects, deleted) with the objects of this store
+            that were created or updated between the tokens 'since' and 'token'
+            and the identifiers of the items that were deleted (or don't
+            match the store's objects anymore).
+
+            Requires the store objects to be a QuerySet of a model that is
+            tracked with delta.track_changes()
+        """
+        objects = self.get_option('objects')
+        if not hasattr(objects, 'model'):
+            raise StoreException('The delta mode requires the store objects to be a QuerySet')
+
+        prefix = get_identifier_prefix(objects.model, self.get_option('compact_identifiers'))
+        saved, deleted = delta.get_changes(objects.model, since, token)
+
+        changed = []
+        if saved:
+            changed = list( objects.filter(pk__in=saved) )
+
+        # Saved objects that are filtered out of the store are gone for the client
+        found = set([ smart_unicode(obj._get_pk_val()) for obj in changed ])
+        deleted += [ pk for pk in saved if pk not in found ]
+
+        return changed, [ prefix + pk for pk in deleted ]
+
+    def to_delta(self, since, fields=None):
+        """ Serialize only the items that changed since the token 'since'
+            into a Python dictionary.
+
+            Besides the usual store data the result holds the key 'deleted'
+            (a list of the deleted item identifiers) and 'token', which should
+            be passed as 'since' with the next request.
+
+            If the changes since the token can't be determined (ie the change
+            log was pruned or 'since' is None) the full store is returned and
+            the key 'full' is set to True.
+        """
+        token = delta.get_change_token()
+
+        if since is None or not delta.is_valid_token(since, token):
+            data = self.to_python(fields=fields)
+            data.update({'full': True, 'deleted': [], 'token': token})
+            return data
+
+        stores = [self] + list( self.get_option('stores') )
+        old_objects = [ store.get_option('objects') for store in stores ]
+
+        deleted = []
+        try:
+            for store in stores:
+                changed, removed = store.get_changed_objects(since, token)
+                store.set_option('objects', changed)
+                deleted += removed
+            data = self.to_python(fields=fields)
+        finally:
+            for store, objects in zip(stores, old_objects):
+                store.set_option('objects', objects)
+
+        data.update({'full': False, 'deleted': deleted, 'token': token})
+        return data
 
     def _start_serialization(self):
         """ Called when serialization of the store begins
@@ -316,15 +626,13 @@ class BaseStore(object):
         # The current object in it's serialized state.
         self._item = {self.get_option('identifier'): self.get_identifier(obj)}
 
-        label = self.get_option('label')
-
-        # Do we have a 'label' and is it already the
-        # name of one of the declared fields?
-        if label and ( label not in self.get_option('fields').keys() ):
+        # Do we have a 'label' that isn't the name of one of the
+        # declared fields (and isn't left out by the sparse fieldset)?
+        if self.has_computed_label():
 
             # Have we defined a 'get_label' method on the store?
             if callable( getattr(self, 'get_label', None) ):
-                self._item[label] = self.get_label(obj)
+                self._item[self.get_option('label')] = self.get_label(obj)
 
     def _handle_field(self, obj, field):
         """ Handle the given field in the Store
@@ -338,7 +646,19 @@ class BaseStore(object):
             'StoreArg': self,
         })
 
-        # Get the value
+        # Get the value (or the memoized one)
+        if field.memoize and self._memoized_keys:
+            key = field.get_memoize_key(obj, self)
+            if key in self._memoized_keys:
+                if key in self._memoized:
+                    value = self._memoized[key][0]
+                else:
+                    value = field.get_value()
+                    # Wrapped, so a value of None can be cached as well
+                    self._memoize_misses.setdefault(field.memoize, {})[key] = (value,)
+                self._item[field.store_field_name] = value
+                return
+
         self._item[field.store_field_name] = field.get_value()
 
     def _end_object(self, obj):
@@ -359,16 +679,50 @@ class BaseStore(object):
         """ Serialize the defined objects and stores into it's final form
         """
         self._start_serialization()
-        for obj in self.get_option('objects'):
-            self._start_object(obj)
+        fields = self.get_fieldset()
+        objects = self.restrict_objects(self.get_option('objects'))
+
+        # Fetch the cached values of all memoized fields at once
+        memoized_fields = [ field for field in fields if field.memoize ]
+        if memoized_fields:
+            objects = list(objects)
+            self._start_memoization(objects, memoized_fields)
+
+        try:
+            for obj in objects:
+                self._start_object(obj)
+
+                for field in fields:
+                    self._handle_field(obj, field)
 
-            for field in self.get_option('fields').values():
-                self._handle_field(obj, field)
+                self._end_object(obj)
+        finally:
+            if memoized_fields:
+                self._end_memoization()
 
-            self._end_object(obj)
         self._end_serialization()
         self._merge_stores()
 
+    def _start_memoization(self, objects, fields):
+        """ Fetches the cached values of the memoized fields for
+            all objects with a single cache.get_many() call
+        """
+        keys = set()
+        for obj in objects:
+            for field in fields:
+                keys.add(field.get_memoize_key(obj, self))
+        self._memoized_keys = keys
+        self._memoized = cache.get_many(list(keys))
+        self._memoize_misses = {}
+
+    def _end_memoization(self):
+        """ Stores the computed values of the memoized fields
+            (grouped by their timeout) with cache.set_many()
+        """
+        for timeout, values in self._memoize_misses.items():
+            cache.set_many(values, timeout)
+        self._memoized_keys = self._memoized = self._memoize_misses = None
+
 class Store(BaseStore):
     """ Just defines the __metaclass__
 
@@ -382,10 +736,23 @@ class ModelQueryStore(Store):
 
         Handles paging, sorting and filtering
 
-        At the moment it requires a custom subclass of QueryReadStore
-        that implements the necessary mechanics to handle server queries
-        the the exported Json RPC 'fetch' method.  Soon it will support
-        QueryReadStore itself.
+        The store can be fetched with a GET request (the query, 'start',
+        'count' and 'sort' are read from the query string) or through the
+        built-in 'fetch' servicemethod, which is exported when a service is
+        set in the Meta class.  Add the service to your URLConf:
+
+        class MyStore(ModelQueryStore):
+            ...
+            class Meta(object):
+                objects = MyModel.objects.all()
+                service = JsonService()
+
+        url(r'^mystore/rpc/$', MyStore().service.view)
+
+        (or MyStore().view, which serves the store and its service at the same url)
+
+        The dojango.data.RpcQueryReadStore client calls that 'fetch' method,
+        so paging, sorting and filtering is done in a single RPC request.
     """
     def __init__(self, *args, **kwargs):
         """
@@ -412,29 +779,31 @@ class ModelQueryStore(Store):
         """
         return objects
 
-    def __call__(self, request):
-        """
-        """
-        self.request = request
+    def get_page(self, request, query, start=0, count=None, sort=None):
+        """ Filters, sorts and paginates the store objects.
 
-        # We need the request.GET QueryDict to be mutable.
-        query_dict = {}
-        for k,v in request.GET.items():
-            query_dict[k] = v
+            'query' is the dict passed to filter_objects, 'sort' the name
+            of the attribute to sort by (prefixed with '-' for descending order)
+            and 'start'/'count' select the page.  The count is limited to the
+            'objects_per_query' option.
 
+            Returns a tuple of the objects on the page and the number of
+            all objects matching the query.
+        """
         # dojox.data.QueryReadStore only handles sorting by a single field
-        sort_attr   = query_dict.pop('sort', None)
+        sort_attr   = sort or None
         descending  = False
         if sort_attr and sort_attr.startswith('-'):
             descending = True
             sort_attr = sort_attr.lstrip('-')
 
         # Paginator is 1-indexed
-        start_index = int( query_dict.pop('start', 0) ) + 1
+        start_index = int( start or 0 ) + 1
 
         # Calculate the count taking objects_per_query into account
         objects_per_query = self.get_option('objects_per_query')
-        count = query_dict.pop('count', objects_per_query)
+        if count is None:
+            count = objects_per_query
 
         # We don't want the client to be able to ask for a million records.
         # They can ask for less, but not more ...
@@ -443,7 +812,7 @@ class ModelQueryStore(Store):
         else:
             count = int(count)
 
-        objects = self.filter_objects(request, self.get_option('objects'), query_dict)
+        objects = self.filter_objects(request, self.get_option('objects'), query)
         objects = self.sort_objects(request, objects, sort_attr, descending)
 
         paginator = Paginator(objects, count)
@@ -455,7 +824,59 @@ class ModelQueryStore(Store):
                 break
 
         page = paginator.page(page_num)
+        return page.object_list, paginator.count
+
+    @servicemethod(idempotent=True)
+    def fetch(self, request, query=None, start=0, count=None, sort=None):
+        """ Returns a page of the store -- the dojo.data response
+            including 'numRows' -- just like a GET request would.
+            (It's idempotent, so clients can call it with a cacheable GET,
+            the responses are private as the objects may depend on the user)
+
+            'sort' is either an attribute name (prefixed with '-' for
+            descending order) or a dojo.data sort array, of which only
+            the first entry is used.
+        """
+        if isinstance(sort, (list, tuple)):
+            sort = sort and sort[0] or None
+        if isinstance(sort, dict):
+            sort = '%s%s' % (sort.get('descending') and '-' or '', sort.get('attribute', ''))
+
+        objects, num_rows = self.get_page(request, dict(query or {}), start, count, sort)
+
+        data = dict(self.to_python(objects=objects))
+        data.pop('SMD', None) # Left over from a previous GET request
+        data['numRows'] = num_rows
+        return data
+
+    def __call__(self, request):
+        """ Returns the requested page of the store as dict
+            (ie for the json_response decorator)
+        """
+        self.request = request
+        return self.get_response_data(request)
+
+    def get_response_data(self, request):
+        """ Returns the page of the store given by the
+            query string (query, 'start', 'count' and 'sort')
+        """
+        # We need the request.GET QueryDict to be mutable.
+        query_dict = {}
+        for k,v in request.GET.items():
+            query_dict[k] = v
+
+        # The sparse fieldset is not part of the query
+        fields = self.get_request_fieldset(request)
+        query_dict.pop('fields', None)
+        columnar = self.is_columnar_request(request)
+        query_dict.pop('format', None)
+
+        sort = query_dict.pop('sort', None)
+        start = query_dict.pop('start', 0)
+        count = query_dict.pop('count', None)
+
+        objects, num_rows = self.get_page(request, query_dict, start, count, sort)
 
-        data = self.to_python(objects=page.object_list)
-        data['numRows'] = paginator.count
+        data = self.to_python(objects=objects, fields=fields, columnar=columnar)
+        data['numRows'] = num_rows
         return data
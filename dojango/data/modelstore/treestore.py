@@ -1,28 +1,293 @@
+import uuid
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist, SuspiciousOperation
+from django.db.models import Count, signals
+from django.db.models.query import QuerySet
+from django.http import Http404
+from django.utils.encoding import smart_unicode
+
+from exceptions import StoreException
 from stores import Store
 from fields import StoreField
 from methods import BaseMethod
+from utils import get_object_from_identifier, get_object_model
+
+def _get_parent_field(Model, parent_field=None):
+    """ Returns the ForeignKey linking a tree node to its parent or
+        None if the Model has no parent link (django-treebeard's MP_Node
+        and NS_Node)
+    """
+    if parent_field is None:
+        mptt_meta = getattr(Model, '_mptt_meta', None)
+        if mptt_meta is not None:
+            parent_field = mptt_meta.parent_attr
+        elif 'parent' in [ f.name for f in Model._meta.fields ]:
+            parent_field = 'parent' # django-treebeard's AL_Node or a plain model
+        else:
+            return None
+    return Model._meta.get_field(parent_field)
+
+def _get_parent_attname(Model, parent_field=None):
+    """ Returns the attribute holding the parent's pk of a tree node,
+        ie 'parent_id', or None if the Model has no parent link
+    """
+    field = _get_parent_field(Model, parent_field)
+    return field is not None and field.attname or None
+
+def _is_adjacency_list(Model, parent_field=None):
+    """ True/False whether the children of a node can only be
+        found with a query on the parent link (no django-mptt,
+        django-treebeard MP_Node or NS_Node tree fields)
+    """
+    return not hasattr(Model, '_mptt_meta') and \
+        _get_parent_field(Model, parent_field) is not None
+
+def annotate_has_children(objects, parent_field=None):
+    """ Annotates the number of children to each node of an adjacency
+        list tree, so has_children() needs no query per node.
+
+        django-mptt and django-treebeard MP/NS nodes know if they are
+        leaves from their tree fields, these objects are returned untouched.
+    """
+    if not hasattr(objects, 'annotate') or not _is_adjacency_list(objects.model, parent_field):
+        return objects
+    field = _get_parent_field(objects.model, parent_field)
+    return objects.annotate(dojango_num_children=Count(field.related_query_name()))
+
+def has_children(obj):
+    """ True/False whether the tree node has any children
+    """
+    if hasattr(obj, 'dojango_num_children'): # see annotate_has_children
+        return obj.dojango_num_children > 0
+    if hasattr(obj, 'is_leaf_node'): # django-mptt
+        return not obj.is_leaf_node()
+    if hasattr(obj, 'is_leaf'): # django-treebeard
+        return not obj.is_leaf()
+    return bool(obj.get_children())
+
+def get_child_objects(obj, parent_field=None):
+    """ Returns the direct children of a tree node
+    """
+    Model = get_object_model(obj)
+    if _is_adjacency_list(Model, parent_field):
+        field = _get_parent_field(Model, parent_field)
+        return Model._default_manager.filter(**{field.name: obj})
+    return obj.get_children()
+
+def get_children_index(roots, parent_field=None):
+    """ Fetches all the nodes below the given root nodes and returns
+        a dict mapping the pk of each node to the list of its children.
+
+        - django-mptt trees are fetched with a single query
+        - django-treebeard MP_Node and NS_Node trees with one query per root
+        - adjacency lists (a 'parent' ForeignKey or the given parent_field)
+          with one query per tree level
+
+        Every node is indexed once, even if the roots contain a node and
+        one of its descendants, and broken (cyclic) parent links don't
+        make it loop forever.
+    """
+    roots = list(roots)
+    index = {}
+    if not roots:
+        return index
+
+    Model = get_object_model(roots[0])
+    parent_attname = _get_parent_attname(Model, parent_field)
+    indexed = set()
+
+    def add(node, parent_pk):
+        if node.pk not in indexed:
+            indexed.add(node.pk)
+            index.setdefault(parent_pk, []).append(node)
+
+    if parent_attname is None:
+        # The descendants are returned in depth-first order,
+        # so the parent is the last node one level above
+        for root in roots:
+            if root.pk in indexed: # the subtree of an ancestor had it already
+                continue
+            parents = {root.get_depth(): root}
+            for node in root.get_descendants():
+                depth = node.get_depth()
+                add(node, parents[depth - 1].pk)
+                parents[depth] = node
+        return index
+
+    if hasattr(Model, '_mptt_meta'):
+        manager = Model._tree_manager
+        if hasattr(manager, 'get_queryset_descendants'):
+            nodes = manager.get_queryset_descendants(
+                Model._default_manager.filter(pk__in=[ root.pk for root in roots ]))
+        else:
+            nodes = []
+            for root in roots:
+                nodes += list(root.get_descendants())
+        for node in nodes:
+            add(node, getattr(node, parent_attname))
+        return index
+
+    # Plain adjacency list, walk down the tree level by level,
+    # every node is only expanded once
+    level = [ root.pk for root in roots ]
+    visited = set(level)
+    while level:
+        nodes = list(Model._default_manager.filter(**{'%s__in' % parent_attname: level}))
+        level = []
+        for node in nodes:
+            add(node, getattr(node, parent_attname))
+            if node.pk not in visited:
+                visited.add(node.pk)
+                level.append(node.pk)
+    return index
+
+def get_ancestor_pks(obj, parent_field=None):
+    """ Returns the pks of all ancestors of a tree node.
+
+        django-mptt and django-treebeard MP/NS nodes are resolved with a
+        single (tree field range) query, adjacency lists by walking up the
+        parent links with one query per level.
+    """
+    Model = get_object_model(obj)
+    if not _is_adjacency_list(Model, parent_field):
+        return list(obj.get_ancestors().values_list('pk', flat=True))
+
+    attname = _get_parent_attname(Model, parent_field)
+    pks = []
+    pk = getattr(obj, attname)
+    while pk is not None and pk not in pks: # don't loop forever on broken trees
+        pks.append(pk)
+        parents = Model._default_manager.filter(pk=pk).values_list(attname, flat=True)
+        pk = parents and parents[0] or None
+    return pks
+
+class SubtreeCache(object):
+    """ Caches the serialized children of the root objects of a TreeStore
+        in the Django cache.
+
+        Every node has a version in the cache that is part of the cache keys
+        of its subtree.  A change of a node replaces the versions of the node
+        and its ancestors (see invalidate_subtrees), which makes just the
+        subtrees containing the node unreachable.
+    """
+    KEY_PREFIX = 'dojango.treestore.'
+
+    def __init__(self, store, timeout):
+        self.store = store
+        self.timeout = timeout
+        self.keys = {} # pk -> subtree cache key
+
+    def _get_subtree_key(self, obj, version):
+        cls = self.store.__class__
+        fieldset = self.store._fieldset
+        key = u'%s.%s|%s|%s|%s|%s|%s' % (
+            cls.__module__, cls.__name__,
+            self.store.get_option('identifier'), self.store.get_option('label'),
+            fieldset and ','.join(sorted(fieldset)) or '*',
+            self.store.get_identifier(obj), version
+        )
+        return self.KEY_PREFIX + md5(key.encode('utf-8')).hexdigest()
+
+    def get_many(self, roots):
+        """ Returns a dict mapping the pks of the given roots to their
+            cached children (for the ones that are cached)
+        """
+        version_keys = dict([ (root.pk, get_version_key(get_object_model(root), root.pk)) for root in roots ])
+        versions = cache.get_many(version_keys.values())
+
+        # Nodes without a version get a new one, so no old
+        # subtree can become reachable again
+        new_versions = dict([ (key, uuid.uuid4().hex) for key in version_keys.values() if key not in versions ])
+        if new_versions:
+            cache.set_many(new_versions)
+            versions.update(new_versions)
+
+        self.keys = dict([ (root.pk, self._get_subtree_key(root, versions[version_keys[root.pk]])) for root in roots ])
+        cached = cache.get_many(self.keys.values())
+        return dict([ (pk, cached[key]) for pk, key in self.keys.items() if key in cached ])
+
+    def set_many(self, subtrees):
+        """ Caches the children of the roots given as dict pk -> children
+        """
+        if subtrees:
+            cache.set_many(dict([ (self.keys[pk], items) for pk, items in subtrees.items() ]), self.timeout)
+
+def get_version_key(Model, pk):
+    """ Returns the cache key of a node's subtree version
+    """
+    key = u'%s__%s' % (smart_unicode(Model._meta), pk)
+    return SubtreeCache.KEY_PREFIX + 'version.' + md5(key.encode('utf-8')).hexdigest()
+
+def invalidate_subtrees(obj, parent_field=None, include_self=True):
+    """ Invalidates the cached subtrees containing the given node
+        (the ones of its ancestors and optionally its own)
+    """
+    pks = get_ancestor_pks(obj, parent_field)
+    if include_self and obj.pk is not None:
+        pks.append(obj.pk)
+    cache.set_many(dict([ (get_version_key(obj.__class__, pk), uuid.uuid4().hex) for pk in pks ]))
+
+def track_subtree_changes(Model, parent_field=None):
+    """ Invalidates the cached subtrees (see TreeStore's 'cache_timeout'
+        option) when a node of the Model is saved or deleted.
+
+        A node that is moved invalidates the subtrees of its old
+        ancestors as well, which costs a query per save.
+    """
+    def on_pre_save(sender, instance, **kwargs):
+        if instance.pk is None:
+            return
+        try:
+            old = sender._default_manager.get(pk=instance.pk)
+        except sender.DoesNotExist:
+            return
+        invalidate_subtrees(old, parent_field)
+
+    def on_change(sender, instance, **kwargs):
+        invalidate_subtrees(instance, parent_field)
+
+    label = smart_unicode(Model._meta)
+    signals.pre_save.connect(on_pre_save, sender=Model, weak=False,
+        dispatch_uid='dojango_subtree_pre_save_%s' % label)
+    signals.post_save.connect(on_change, sender=Model, weak=False,
+        dispatch_uid='dojango_subtree_save_%s' % label)
+    signals.post_delete.connect(on_change, sender=Model, weak=False,
+        dispatch_uid='dojango_subtree_delete_%s' % label)
 
 class ChildrenMethod(BaseMethod):
     """ A method proxy that will resolve the children
         of a model that has a tree structure.
         "django-treebeard" and "django-mptt" both attach a get_children method
         to the model.
+
+        When used within a TreeStore the children are taken from the
+        prefetched tree (see TreeStore.get_children_data)
     """
-    def get_value(self):
+    def get_value(self, *args, **kwargs):
         store = self.field.proxied_args['StoreArg']
         obj = self.field.proxied_args['ObjectArg']
         ret = []
-        # TODO: optimize using get_descendants()
-        if hasattr(obj, "get_children"):
+        if callable(getattr(store, 'get_children_data', None)):
+            ret = store.get_children_data(obj)
+        elif hasattr(obj, "get_children"):
             ret = store.__class__(objects=obj.get_children(), is_nested=True).to_python()
         return ret
 
 class ChildrenField(StoreField):
     """ A field that renders children items
         If your model provides a get_children method you can use that field
-        to render all children recursively. 
+        to render all children recursively.
         (see "django-treebeard", "django-mptt")
     """
+    def get_model_fields(self):
+        # get_children() relies on the tree fields of the model
+        return None
+
     def get_value(self):
         self._get_value = ChildrenMethod(self.model_field_name)
         self._get_value.field = self
@@ -32,13 +297,163 @@ class TreeStore(Store):
     """ A store that already includes the children field with no additional
         options. Just subclass that Store, add the to-be-rendered fields and
         attach a django-treebeard (or django-mptt) model to its Meta class:
-        
+
         class MyStore(TreeStore):
             username = StoreField()
             first_name = StoreField()
-            
+
             class Meta:
                 objects = YourTreeModel.objects.filter(id=1) # using treebeard or mptt
                 label = 'username'
+
+        The whole tree below the objects is fetched at once and rendered
+        by this store instance.  Plain models with a ForeignKey to
+        themselves can be used as well, set 'parent_field' in the Meta
+        class if that ForeignKey isn't called 'parent'.
+
+        Set 'lazy = True' in the Meta class (or pass lazy=True) to just
+        render the root objects.  Nodes with children get a 'children: true'
+        stub and every node a 'hasChildren' flag.  The direct children of a
+        node are returned as a list when the store is called with the
+        node's identifier, ie: /my/tree/?node=myapp.category__12
+        (as needed for the lazy loading of dijit.Tree)
+
+        Set 'cache_timeout' (in seconds) in the Meta class to cache the
+        serialized subtrees of the root objects.  Register the model with
+        track_subtree_changes() so a change of a node invalidates the cached
+        subtrees of its ancestors.  Don't use it with fields whose values
+        depend on the request.
     """
-    children = ChildrenField()
\ No newline at end of file
+    children = ChildrenField()
+
+    _children_index = None
+    _subtree_cache = None
+    _cached_subtrees = None
+    _depth = 0
+    _path = () # the pks of the nodes whose children are being rendered
+
+    def __init__(self, *args, **kwargs):
+        lazy = kwargs.pop('lazy', None)
+
+        super(TreeStore, self).__init__(*args, **kwargs)
+
+        if lazy is not None:
+            self.set_option('lazy', lazy)
+        elif not self.has_option('lazy'):
+            self.set_option('lazy', False)
+
+    def get_parent_field(self):
+        """ The 'parent_field' option or None
+        """
+        return self.has_option('parent_field') and self.get_option('parent_field') or None
+
+    def get_response_data(self, request):
+        """ Returns the direct children of the node given by the
+            'node' parameter or the whole store otherwise.
+
+            Raises Http404 if the node isn't one of the store's objects and
+            SuspiciousOperation (400 Bad Request) if it's no valid identifier.
+        """
+        node = request.GET.get('node', None)
+        if node is None:
+            return super(TreeStore, self).get_response_data(request)
+
+        objects = self.get_option('objects')
+        queryset = None
+        if isinstance(objects, QuerySet):
+            queryset = objects
+        try:
+            # Just nodes of the store can be expanded
+            obj = get_object_from_identifier(node, valid=getattr(objects, 'model', None),
+                queryset=queryset)
+        except (StoreException, ValueError), e:
+            raise SuspiciousOperation('Invalid node "%s": %s' % (node, e)) # 400 Bad Request
+        except ObjectDoesNotExist:
+            obj = None
+        if obj is None or (queryset is None and obj not in objects):
+            raise Http404('No node "%s" in the store' % node)
+        children = get_child_objects(obj, self.get_parent_field())
+
+        is_nested = self.is_nested
+        self.is_nested = True
+        try:
+            return self.to_python(objects=children, fields=self.get_request_fieldset(request))
+        finally:
+            self.is_nested = is_nested
+            self.data = self.is_nested and [] or {}
+
+    def _start_object(self, obj):
+        super(TreeStore, self)._start_object(obj)
+        if self.get_option('lazy'):
+            self._item['hasChildren'] = has_children(obj)
+
+    def _serialize(self):
+        """ Fetch the tree before serializing the root objects
+        """
+        parent_field = self.get_parent_field()
+
+        if self.get_option('lazy'):
+            objects = self.get_option('objects')
+            self.set_option('objects', annotate_has_children(objects, parent_field))
+            try:
+                super(TreeStore, self)._serialize()
+            finally:
+                self.set_option('objects', objects)
+            return
+
+        # Don't query the root objects twice
+        objects = self.get_option('objects')
+        roots = list(objects)
+
+        # Only fetch the trees that aren't cached
+        self._cached_subtrees = {}
+        if self.has_option('cache_timeout') and self.get_option('cache_timeout'):
+            self._subtree_cache = SubtreeCache(self, self.get_option('cache_timeout'))
+            self._cached_subtrees = self._subtree_cache.get_many(roots)
+        new_subtrees = self._new_subtrees = {}
+
+        self._children_index = get_children_index(
+            [ root for root in roots if root.pk not in self._cached_subtrees ], parent_field)
+        self.set_option('objects', roots)
+        try:
+            super(TreeStore, self)._serialize()
+            if self._subtree_cache is not None:
+                self._subtree_cache.set_many(new_subtrees)
+        finally:
+            self.set_option('objects', objects)
+            self._children_index = None
+            self._subtree_cache = self._cached_subtrees = self._new_subtrees = None
+
+    def get_children_data(self, obj):
+        """ Returns the serialized children of the given object
+            (or just a stub in lazy mode)
+        """
+        if self.get_option('lazy'):
+            return self._item['hasChildren'] or []
+
+        is_root = self._depth == 0
+        if is_root and obj.pk in self._cached_subtrees:
+            return self._cached_subtrees[obj.pk]
+
+        parent_item = self._item
+        items = []
+        fields = self.get_fieldset()
+        path = self._path
+        self._path = path + (obj.pk,)
+        self._depth += 1
+        try:
+            for child in self._children_index.get(obj.pk, []):
+                if child.pk in self._path: # a broken tree with a cycle
+                    continue
+                self._start_object(child)
+                for field in fields:
+                    self._handle_field(child, field)
+                items.append(self._item)
+        finally:
+            self._depth -= 1
+            self._path = path
+        self._item = parent_item
+
+        if is_root and self._subtree_cache is not None:
+            self._new_subtrees[obj.pk] = items
+        return items
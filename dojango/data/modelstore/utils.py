@@ -1,40 +1,171 @@
 from django.utils.datastructures import SortedDict
 from django.db.models import get_model
+from django.utils.encoding import smart_unicode
 from fields import StoreField
 from exceptions import StoreException
 
-def get_object_from_identifier(identifier, valid=None):
-    """ Helper function to resolve an item identifier
-        into a model instance.
+# Cache of the models looked up by their 'app.model' string
+# (and the compact identifier codes, see register_identifier_code)
+_models = {}
 
-        Raises StoreException if the identifier is invalid
-        or the requested Model could not be found
+# Model -> compact identifier code
+_codes = {}
 
-        Raises <Model>.DoesNotExist if the object lookup fails
+# Cache of the identifier prefixes, (Model, compact) -> prefix
+_prefixes = {}
 
-        Arguments (optional):
+def register_identifier_code(Model, code):
+    """ Registers a short code for the Model, used by Stores with the
+        'compact_identifiers' option instead of '<app_label>.<model_name>':
 
-            valid
-                One or more Django model classes to compare the
-                returned model instance to.
+        >>> register_identifier_code(Product, 'p')
+
+        The identifiers of Product objects will look like 'p__42' instead
+        of 'shop.product__42'.  Codes must not contain '.' or '__' and have to
+        be registered in all processes (ie in models.py), since the
+        identifiers are resolved with them.
+    """
+    if '.' in code or '__' in code:
+        raise StoreException('Invalid identifier code "%s"' % code)
+    if _models.get(code, Model) is not Model:
+        raise StoreException('Identifier code "%s" is already registered' % code)
+    _codes[Model] = code
+    _models[code] = Model
+    _prefixes.pop((Model, True), None)
+
+def get_object_model(obj):
+    """ Returns the Model of the object -- for objects of a QuerySet.only()
+        or defer() the Model their deferred class stands in for, so they
+        get the same identifiers as all other objects.
+    """
+    Model = obj.__class__
+    if getattr(obj, '_deferred', False):
+        Model = Model._meta.proxy_for_model
+    return Model
+
+def get_identifier_prefix(Model, compact=False):
+    """ Returns the (cached) prefix of the identifiers of the Model's
+        objects, ie u'auth.user__' (or u'u__' with a registered compact code)
     """
     try:
-        model_str, pk = identifier.split('__')
-    except ValueError:
-        raise StoreException('Invalid identifier string')
+        return _prefixes[(Model, compact)]
+    except KeyError:
+        pass
+    if compact and Model in _codes:
+        prefix = u'%s__' % _codes[Model]
+    else:
+        prefix = u'%s__' % smart_unicode(Model._meta)
+    _prefixes[(Model, compact)] = prefix
+    return prefix
 
-    Model = get_model(*model_str.split('.'))
+def _get_model(model_str):
+    """ Returns the Model given by an '<app_label>.<model_name>' string
+        or a compact identifier code (the lookup is cached)
+    """
+    try:
+        return _models[model_str]
+    except KeyError:
+        pass
+
+    try:
+        Model = get_model(*model_str.split('.'))
+    except (LookupError, TypeError, ValueError):
+        Model = None
     if Model is None:
         raise StoreException('Model from identifier string "%s" not found' % model_str)
 
+    _models[model_str] = Model
+    return Model
+
+def _parse_identifier(identifier, valid=None):
+    """ Splits an item identifier into the Model and the pk
+    """
+    try:
+        model_str, pk = identifier.split('__', 1)
+    except (ValueError, AttributeError):
+        raise StoreException('Invalid identifier string')
+
+    Model = _get_model(model_str)
+
     if valid is not None:
         if not isinstance(valid, (list, tuple) ):
             valid = (valid,)
         if Model not in valid:
             raise StoreException('Model type mismatch')
 
+    return Model, pk
+
+def get_object_from_identifier(identifier, valid=None, queryset=None):
+    """ Helper function to resolve an item identifier
+        into a model instance.
+
+        Raises StoreException if the identifier is invalid
+        or the requested Model could not be found
+
+        Raises <Model>.DoesNotExist if the object lookup fails
+
+        Arguments (optional):
+
+            valid
+                One or more Django model classes to compare the
+                returned model instance to.
+
+            queryset
+                The object is looked up in this QuerySet (of the Model)
+                instead of all objects of the Model.
+    """
+    Model, pk = _parse_identifier(identifier, valid)
+
+    if queryset is None or queryset.model is not Model:
+        queryset = Model._default_manager.all()
+
     # This will raise Model.DoesNotExist if lookup fails
-    return Model._default_manager.get(pk=pk)
+    return queryset.get(pk=pk)
+
+def get_objects_from_identifiers(identifiers, valid=None):
+    """ Helper function to resolve a list of item identifiers
+        into model instances with a single query per model.
+
+        Returns a tuple of the list of objects (in the order of the
+        identifiers) and the list of identifiers that weren't found.
+
+        Raises StoreException if an identifier is invalid or
+        one of the requested Models could not be found
+
+        Arguments (optional):
+
+            valid
+                One or more Django model classes to compare the
+                returned model instances to.
+
+        Usage:
+
+            >>> objects, missing = get_objects_from_identifiers(['auth.user__1', 'auth.user__5'])
+    """
+    parsed = [ _parse_identifier(identifier, valid) for identifier in identifiers ]
+
+    # Group the pks by model
+    pks = {}
+    for Model, pk in parsed:
+        pks.setdefault(Model, []).append(pk)
+
+    found = {}
+    for Model, model_pks in pks.items():
+        try:
+            objects = Model._default_manager.in_bulk(model_pks)
+        except (ValueError, TypeError):
+            raise StoreException('Invalid identifier string')
+        for pk, obj in objects.items():
+            found[(Model, smart_unicode(pk))] = obj
+
+    objects, missing = [], []
+    for identifier, (Model, pk) in zip(identifiers, parsed):
+        obj = found.get((Model, smart_unicode(pk)))
+        if obj is None:
+            missing.append(identifier)
+        else:
+            objects.append(obj)
+    return objects, missing
 
 def get_fields_and_servicemethods(bases, attrs, include_bases=True):
     """ This function was pilfered (and slightly modified) from django/forms/forms.py
@@ -0,0 +1,329 @@
+""" A generic server endpoint for dojox.data.JsonRestStore
+
+    >>> products = JsonRestStoreView(Product.objects.all(), fields=['name', 'price'])
+
+    In your URLConf (the id part is optional):
+
+    >>> url(r'^products/(?P<id>[^/]+)?$', products)
+
+    and on the client:
+
+    >>> new dojox.data.JsonRestStore({target: "/products/"});
+
+    Supported requests:
+
+        GET /products/          The objects in the 'Range: items=0-24' header,
+                                answered with 'Content-Range: items 0-24/<total>'
+        GET /products/<id>      A single object
+        PUT /products/<id>      Updates the object
+        POST /products/         Creates an object
+        DELETE /products/<id>   Deletes the object
+
+    GET /products/?name=foo filters the objects (see info_class), just the
+    serialized fields can be used in filters and sorting, with the lookups
+    in JsonRestStoreView.filter_lookups (ie ?price__lt=10, ?name__in=a,b).
+    Relations can't be followed.
+
+    A POST of a list of items (or a dict {"save": [items], "delete": [ids]})
+    to /products/ is a bulk save: items with an id are updated, items without
+    are created and all of it happens in a single transaction.  The updates
+    are written with one UPDATE ... SET field = CASE WHEN pk = ... statement
+    per batch (Django >= 1.8), the new objects with bulk_create where the
+    database returns their primary keys.  The pre_save and post_save signals
+    are sent for these objects as well (so change tracking and cache
+    invalidation keep working), but a save() method of the model isn't called.
+"""
+
+from django import VERSION as django_version
+if django_version >= (1, 5, 0):
+    import json
+else:
+    from django.utils import simplejson as json
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.db.models import signals
+from django.http import HttpResponse, HttpResponseBadRequest, \
+    HttpResponseNotAllowed, Http404
+if django_version >= (1, 8, 0):
+    from django.db.models import Case, When, Value
+
+from dojango.util import to_json_response
+
+from dojango.data import JsonRestStoreInfo
+
+__all__ = ('JsonRestStoreView',)
+
+class JsonRestStoreView(object):
+    """ A view serving the objects of a queryset to a dojox.data.JsonRestStore
+
+        Arguments (optional):
+
+            fields:
+                The names of the model fields that are serialized and can be
+                written by the client (ForeignKeys are sent as the related pk).
+                Default are all concrete fields except the primary key.
+
+            max_count:
+                The maximum number of objects returned by a GET request.
+
+            id_attribute:
+                The name of the identity attribute of the items (the idAttribute
+                of the JsonRestStore), it holds the primary key.
+
+        Override get_queryset to restrict the objects (ie per user), all
+        reads and writes go through it.
+    """
+    info_class = JsonRestStoreInfo
+    # The number of objects written by a single UPDATE statement of a bulk save
+    bulk_update_batch_size = 100
+    # The lookups the client can use in filters (field__<lookup>)
+    filter_lookups = ('exact', 'iexact', 'contains', 'icontains', 'gt', 'gte',
+                      'lt', 'lte', 'in', 'startswith')
+
+    def __init__(self, queryset, fields=None, max_count=25, id_attribute='id'):
+        self.queryset = queryset
+        self.model = queryset.model
+        if fields is None:
+            fields = [ f.name for f in self.model._meta.fields if not f.primary_key ]
+        self.fields = [ self.model._meta.get_field(name) for name in fields ]
+        self.max_count = max_count
+        self.id_attribute = id_attribute
+
+    def __call__(self, request, id=None):
+        if request.method not in ('GET', 'PUT', 'POST', 'DELETE'):
+            return HttpResponseNotAllowed(['GET', 'PUT', 'POST', 'DELETE'])
+        try:
+            return getattr(self, request.method.lower())(request, id)
+        except ValueError, e: # The request body is no valid Json
+            return HttpResponseBadRequest(str(e))
+        except ValidationError, e:
+            return self.validation_error(request, e)
+
+    def get_queryset(self, request):
+        """ Returns the objects the client can access
+        """
+        return self.queryset.all()
+
+    def get_field_names(self):
+        """ Returns the names the client can filter and sort by
+        """
+        return [ field.name for field in self.fields ] + ['pk']
+
+    def get_filter_lookup(self, lookup):
+        """ Returns the lookup (ie 'price__lt') if the client can filter by it,
+            otherwise None: just the serialized fields themselves with one of
+            the filter_lookups, no relations
+        """
+        parts = lookup.split('__')
+        if parts[0] not in self.get_field_names() or len(parts) > 2:
+            return None
+        if len(parts) == 2 and parts[1] not in self.filter_lookups:
+            return None
+        return str(lookup)
+
+    def filter_queryset(self, request, queryset, info):
+        """ Applies the filters and the sorting extracted by the info
+            (see info_class) to the queryset, lookups that aren't allowed
+            (see get_filter_lookup) are ignored
+        """
+        names = self.get_field_names()
+        if hasattr(info, 'get_filter'): # JsonQueryRestStoreInfo
+            q = info.get_filter(self.model)
+            if q is not None:
+                queryset = queryset.filter(q)
+        filters = {}
+        for lookup, value in info.filters.items():
+            lookup = self.get_filter_lookup(lookup)
+            if lookup is None:
+                continue
+            if lookup.endswith('__in'):
+                value = value.split(',')
+            filters[lookup] = value
+        sorting = [ sort for sort in info.sorting if sort.lstrip('-') in names ]
+        return queryset.filter(**filters).order_by(*sorting)
+
+    def get_object(self, request, id):
+        try:
+            return self.get_queryset(request).get(pk=id)
+        except (self.model.DoesNotExist, ValueError):
+            raise Http404('No %s with the id "%s"' % (self.model._meta.object_name, id))
+
+    def serialize(self, obj):
+        """ Returns the item of the object
+        """
+        item = {self.id_attribute: obj._get_pk_val()}
+        for field in self.fields:
+            item[field.name] = getattr(obj, field.attname)
+        return item
+
+    def update_object(self, obj, item):
+        """ Sets the fields of the object from the item sent by the
+            client and validates it (just the writable fields)
+        """
+        if not isinstance(item, dict):
+            raise ValueError('An item has to be an object')
+        errors = {}
+        for field in self.fields:
+            if field.name in item:
+                try:
+                    setattr(obj, field.attname, field.to_python(item[field.name]))
+                except ValidationError, e:
+                    errors[field.name] = e.messages
+        writable = set([ field.name for field in self.fields if field.name not in errors ])
+        try:
+            obj.full_clean(exclude=[ f.name for f in obj._meta.fields if f.name not in writable ])
+        except ValidationError, e:
+            for name, messages in e.message_dict.items():
+                errors.setdefault(name, []).extend(messages)
+        if errors:
+            raise ValidationError(errors)
+        return obj
+
+    def read_body(self, request):
+        return json.loads(request.body)
+
+    def response(self, request, data, status=200):
+        response = to_json_response(data, request=request)
+        response.status_code = status
+        return response
+
+    def validation_error(self, request, error):
+        messages = getattr(error, 'message_dict', None) or {'__all__': error.messages}
+        return self.response(request, {'errors': messages}, status=400)
+
+    def get(self, request, id=None):
+        if id:
+            return self.response(request, self.serialize(self.get_object(request, id)))
+
+        info = self.info_class(request, max_count=self.max_count,
+            allowed_fields=self.get_field_names())
+        info.extract()
+
+        queryset = self.filter_queryset(request, self.get_queryset(request), info)
+        total = queryset.count()
+        items = [ self.serialize(obj) for obj in queryset[info.start:info.end] ]
+
+        response = self.response(request, items)
+        if items:
+            response['Content-Range'] = 'items %d-%d/%d' % (info.start, info.start + len(items) - 1, total)
+        else:
+            response['Content-Range'] = 'items */%d' % total
+        return response
+
+    def put(self, request, id=None):
+        if not id:
+            return HttpResponseNotAllowed(['GET', 'POST'])
+        obj = self.update_object(self.get_object(request, id), self.read_body(request))
+        obj.save()
+        return self.response(request, self.serialize(obj))
+
+    def post(self, request, id=None):
+        if id:
+            return HttpResponseNotAllowed(['GET', 'PUT', 'DELETE'])
+        data = self.read_body(request)
+        if isinstance(data, list) or (isinstance(data, dict) and ('save' in data or 'delete' in data)):
+            return self.bulk_save(request, data)
+
+        obj = self.update_object(self.model(), data)
+        obj.save()
+        response = self.response(request, self.serialize(obj), status=201)
+        response['Location'] = request.path.rstrip('/') + '/' + str(obj._get_pk_val())
+        return response
+
+    def delete(self, request, id=None):
+        if not id:
+            return HttpResponseNotAllowed(['GET', 'POST'])
+        self.get_object(request, id).delete()
+        return HttpResponse(status=204)
+
+    def bulk_save(self, request, data):
+        """ Saves a list of items (or a dict {"save": [items], "delete": [ids]})
+            within one transaction -- nothing is saved if an item is invalid
+            or refers to an unknown object.
+
+            Returns the saved items and the deleted ids.
+        """
+        if isinstance(data, list):
+            data = {'save': data}
+        items, deleted = data.get('save', []), data.get('delete', [])
+        if not isinstance(items, list) or not isinstance(deleted, list):
+            raise ValueError('"save" and "delete" have to be lists')
+        for item in items:
+            if not isinstance(item, dict):
+                raise ValueError('An item has to be an object')
+
+        ids = [ item[self.id_attribute] for item in items if item.get(self.id_attribute) is not None ]
+        db = router.db_for_write(self.model)
+
+        with transaction.atomic(using=db):
+            queryset = self.get_queryset(request)
+            existing = queryset.in_bulk(ids)
+            # in_bulk returns the keys as stored in the database
+            existing = dict([ (unicode(pk), obj) for pk, obj in existing.items() ])
+
+            updated, created = [], []
+            for item in items:
+                id = item.get(self.id_attribute)
+                if id is None:
+                    created.append(self.update_object(self.model(), item))
+                elif unicode(id) in existing:
+                    updated.append(self.update_object(existing[unicode(id)], item))
+                else:
+                    raise Http404('No %s with the id "%s"' % (self.model._meta.object_name, id))
+
+            self._bulk_update(updated, db)
+            self._bulk_create(created, db)
+            if deleted:
+                queryset.filter(pk__in=deleted).delete()
+
+        return self.response(request, {
+            'save': [ self.serialize(obj) for obj in updated + created ],
+            'delete': deleted,
+        })
+
+    def _bulk_update(self, objects, db):
+        if not objects:
+            return
+        if django_version < (1, 8, 0): # No conditional expressions
+            for obj in objects:
+                obj.save(using=db)
+            return
+
+        manager = self.model._default_manager.db_manager(db)
+        # All fields are written, like save() does
+        fields = [ field for field in self.model._meta.concrete_fields if not field.primary_key ]
+        size = self.bulk_update_batch_size
+        for i in range(0, len(objects), size):
+            batch = objects[i:i + size]
+            self._send_save_signal(signals.pre_save, batch, db)
+            values = {}
+            for field in fields:
+                # pre_save sets auto_now fields
+                values[field.name] = Case(output_field=field, *[
+                    When(pk=obj._get_pk_val(), then=Value(field.pre_save(obj, False), output_field=field))
+                    for obj in batch
+                ])
+            manager.filter(pk__in=[ obj._get_pk_val() for obj in batch ]).update(**values)
+            self._send_save_signal(signals.post_save, batch, db, created=False)
+
+    def _bulk_create(self, objects, db):
+        if not objects:
+            return
+        # The created items need their new primary keys
+        features = connections[db].features
+        if getattr(features, 'can_return_rows_from_bulk_insert', False) or \
+            getattr(features, 'can_return_ids_from_bulk_insert', False):
+            self._send_save_signal(signals.pre_save, objects, db)
+            self.model._default_manager.db_manager(db).bulk_create(objects)
+            self._send_save_signal(signals.post_save, objects, db, created=True)
+        else:
+            for obj in objects:
+                obj.save(using=db)
+
+    def _send_save_signal(self, signal, objects, db, **kwargs):
+        """ Sends pre_save or post_save for objects written in bulk, as
+            save() would (ie for track_changes and the cache invalidation)
+        """
+        for obj in objects:
+            signal.send(sender=self.model, instance=obj, raw=False, using=db,
+                        update_fields=None, **kwargs)
@@ -141,7 +141,7 @@ def __prepare_json_ret(request, ret, callback_param_name=None, use_iframe=False)
     json_ret = ""
     try:
         # Sometimes the serialization fails, i.e. when there are too deeply nested objects or even classes inside
-        json_ret = to_json_response(ret, func_name, use_iframe)
+        json_ret = to_json_response(ret, func_name, use_iframe, request=request)
     except Exception, e:
         print '\n\n===============Exception=============\n\n'+str(e)+'\n\n' 
         print ret
@@ -0,0 +1,20 @@
+dojo.provide("dojango.data.ColumnarQueryReadStore");
+
+dojo.require("dojox.data.QueryReadStore");
+dojo.require("dojango.data.ColumnarReadStore");
+
+dojo.declare("dojango.data.ColumnarQueryReadStore", dojox.data.QueryReadStore, {
+	// summary:
+	//	A QueryReadStore that requests the compact columnar format of dojango
+	//	(e.g. from a ModelQueryStore or the dojango datagrid-list view) and
+	//	expands each fetched page into items.
+
+	fetch: function(/* Object */request){
+		request.serverQuery = dojo.mixin({format: "columnar"}, request.serverQuery || {});
+		return this.inherited(arguments);
+	},
+
+	_filterResponse: function(/* Object */data){
+		return dojango.data.expandColumnar(data);
+	}
+});
@@ -0,0 +1,60 @@
+dojo.provide("dojango.data.ColumnarReadStore");
+
+dojo.require("dojo.data.ItemFileReadStore");
+
+dojango.data.expandColumnar = function(/* Object */data){
+	// summary:
+	//	Expands data in the compact columnar format (see dojango.util.to_columnar)
+	//	into the usual dojo.data format. Any other data is returned untouched.
+	//
+	//	Attributes listed in data.missing (row index -> column indexes) are left
+	//	out of the item, null values are kept.
+	// data: Object
+	//	{columns: [..], references: [..], rows: [[..], ..], missing: {..}, identifier: .., ..}
+	if(!data || data.format != "columnar"){
+		return data;
+	}
+	var columns = data.columns, rows = data.rows, missing = data.missing || {}, refs = {}, items = [];
+	dojo.forEach(data.references || [], function(column){
+		refs[column] = true;
+	});
+	for(var i=0,l=rows.length;i<l;i++){
+		var row = rows[i], item = {}, absent = {};
+		dojo.forEach(missing[i] || [], function(j){
+			absent[j] = true;
+		});
+		for(var j=0,k=columns.length;j<k;j++){
+			var value = row[j], column = columns[j];
+			if(absent[j]){
+				continue; // the item doesn't have that attribute
+			}
+			if(refs[column] && value !== null){
+				value = dojo.isArray(value) ?
+					dojo.map(value, function(id){ return {_reference: id}; }) :
+					{_reference: value};
+			}
+			item[column] = value;
+		}
+		items.push(item);
+	}
+	var ret = {};
+	for(var key in data){
+		if(!(key in {format: 1, columns: 1, references: 1, rows: 1, missing: 1})){
+			ret[key] = data[key];
+		}
+	}
+	ret.items = items;
+	return ret;
+}
+
+dojo.declare("dojango.data.ColumnarReadStore", dojo.data.ItemFileReadStore, {
+	// summary:
+	//	An ItemFileReadStore that reads the compact columnar format of dojango
+	//	(e.g. a modelstore Store called with ?format=columnar). The rows are
+	//	expanded into items when the store loads its data, which is on the first
+	//	fetch. Data in the normal dojo.data format is read as well.
+
+	_getItemsFromLoadedData: function(/* Object */dataObject){
+		return this.inherited(arguments, [dojango.data.expandColumnar(dataObject)]);
+	}
+});
@@ -0,0 +1,49 @@
+dojo.provide("dojango.data.RpcQueryReadStore");
+
+dojo.require("dojox.data.QueryReadStore");
+dojo.require("dojango.rpc.JsonService");
+
+dojo.declare("dojango.data.RpcQueryReadStore", dojox.data.QueryReadStore, {
+	// summary:
+	//	A QueryReadStore that fetches its pages through the 'fetch'
+	//	servicemethod of a dojango ModelQueryStore, so paging, sorting and
+	//	filtering all happen on the server within one JSON-RPC call.
+	//
+	//	var store = new dojango.data.RpcQueryReadStore({url: "/mystore/rpc/"});
+	//
+	//	The url points to the JsonService of the store, it is used to load
+	//	the SMD (alternatively pass an existing dojango.rpc.JsonService as
+	//	'service').
+
+	// service: dojango.rpc.JsonService
+	//	The service exposing the 'fetch' method
+	service: null,
+
+	// method: String
+	//	The name of the servicemethod to call
+	method: "fetch",
+
+	constructor: function(/* Object */params){
+		if(!this.service){
+			this.service = new dojango.rpc.JsonService(this.url);
+		}
+	},
+
+	_fetchItems: function(/* Object */request, /* Function */fetchHandler, /* Function */errorHandler){
+		var query = dojo.mixin({}, request.serverQuery || request.query || {});
+		// Only the first sort attribute is used by the server
+		var sort = null;
+		if(request.sort && request.sort.length){
+			sort = (request.sort[0].descending ? "-" : "") + request.sort[0].attribute;
+		}
+		var count = isFinite(request.count) ? request.count : null;
+
+		var deferred = this.service[this.method](query, request.start || 0, count, sort);
+		deferred.addCallback(dojo.hitch(this, function(data){
+			this._xhrFetchHandler(data, request, fetchHandler, errorHandler);
+		}));
+		deferred.addErrback(function(error){
+			errorHandler(error, request);
+		});
+	}
+});
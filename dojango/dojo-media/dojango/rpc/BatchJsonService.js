@@ -0,0 +1,103 @@
+dojo.provide("dojango.rpc.BatchJsonService");
+
+dojo.require("dojango.rpc.JsonService");
+
+dojo.declare("dojango.rpc.BatchJsonService", dojango.rpc.JsonService, {
+	// summary:
+	//	A JsonService that collects all servicemethod calls made within
+	//	batchDelay milliseconds and sends them as one JSON-RPC batch request
+	//	(a list of calls) to a dojango JsonService (or Store) URL.
+	//	The results are dispatched to the deferreds of the single calls, so
+	//	it can be used exactly like dojo.rpc.JsonService:
+	//
+	//	var service = new dojango.rpc.BatchJsonService("/my/store/");
+	//	service.getCountries().addCallback(...);
+	//	service.getStates("US").addCallback(...); // sent within the same request
+	//
+	//	Idempotent servicemethods are still called with single (cacheable)
+	//	GET requests.
+
+	// batchDelay: Integer
+	//	Milliseconds to wait for more calls before the batch is sent
+	batchDelay: 0,
+
+	// maxBatchSize: Integer
+	//	A batch is sent immediately when it reaches that many calls
+	maxBatchSize: 20,
+
+	_queue: null,
+	_timer: null,
+
+	bind: function(method, parameters, deferredRequestHandler, url){
+		// summary:
+		//	Queues the call instead of sending it right away
+		if(this.isGetMethod(method)){
+			return this.inherited(arguments);
+		}
+		url = url || this.serviceUrl;
+		if(this._queue && this._queue.url != url){
+			this.flush();
+		}
+		if(!this._queue){
+			this._queue = {url: url, calls: []};
+		}
+		this._queue.calls.push({
+			id: this.lastSubmissionId++,
+			method: method,
+			params: parameters || [],
+			handler: deferredRequestHandler
+		});
+		if(this._queue.calls.length >= this.maxBatchSize){
+			this.flush();
+		}else if(!this._timer){
+			this._timer = setTimeout(dojo.hitch(this, "flush"), this.batchDelay);
+		}
+	},
+
+	flush: function(){
+		// summary:
+		//	Sends all queued calls as a single batch request
+		if(this._timer){
+			clearTimeout(this._timer);
+			this._timer = null;
+		}
+		var queue = this._queue;
+		this._queue = null;
+		if(!queue){
+			return;
+		}
+		var handlers = {};
+		var calls = dojo.map(queue.calls, function(call){
+			handlers[call.id] = call.handler;
+			return {id: call.id, method: call.method, params: call.params};
+		});
+		dojo.rawXhrPost({
+			url: queue.url,
+			postData: dojo.toJson(calls),
+			contentType: this.contentType,
+			timeout: this.timeout,
+			handleAs: "json-comment-optional"
+		}).addCallbacks(dojo.hitch(this, function(responses){
+			if(!dojo.isArray(responses)){
+				// the whole request failed, i.e. it couldn't be parsed
+				responses = dojo.map(calls, function(call){
+					return dojo.mixin({}, responses, {id: call.id});
+				});
+			}
+			dojo.forEach(responses, function(response){
+				var handler = handlers[response.id];
+				if(handler){
+					delete handlers[response.id];
+					this.resultCallback(handler)(response);
+				}
+			}, this);
+			for(var id in handlers){
+				this.errorCallback(handlers[id])(new Error("No response for call " + id));
+			}
+		}), dojo.hitch(this, function(error){
+			for(var id in handlers){
+				this.errorCallback(handlers[id])(error);
+			}
+		}));
+	}
+});
@@ -0,0 +1,67 @@
+dojo.provide("dojango.rpc.JsonService");
+
+dojo.require("dojo.rpc.JsonService");
+
+dojango.rpc.canonicalJson = function(/* anything */value){
+	// summary:
+	//	Serializes the value like dojango.data.modelstore.canonical_json on
+	//	the server (sorted keys, no whitespace), so the same params always
+	//	result in the same GET url.
+	if(dojo.isArray(value)){
+		return "[" + dojo.map(value, dojango.rpc.canonicalJson).join(",") + "]";
+	}
+	if(value && typeof value == "object" && !(value instanceof Date)){
+		var keys = [];
+		for(var key in value){
+			if(value.hasOwnProperty(key) && value[key] !== undefined && typeof value[key] != "function"){
+				keys.push(key);
+			}
+		}
+		return "{" + dojo.map(keys.sort(), function(key){
+			return dojo.toJson(key) + ":" + dojango.rpc.canonicalJson(value[key]);
+		}).join(",") + "}";
+	}
+	return dojo.toJson(value);
+};
+
+dojo.declare("dojango.rpc.JsonService", dojo.rpc.JsonService, {
+	// summary:
+	//	A JsonService that calls the servicemethods marked with
+	//	'transport: "GET"' in the SMD (idempotent dojango servicemethods)
+	//	with cacheable GET requests:
+	//
+	//	/my/store/?method=getCountries&params=["US"]
+	//
+	//	All other methods are called with POST requests, as usual.
+
+	_getMethods: null,
+
+	processSmd: function(/* Object */object){
+		this._getMethods = {};
+		dojo.forEach(object.methods || [], function(m){
+			if(m.transport == "GET"){
+				this._getMethods[m.name] = true;
+			}
+		}, this);
+		this.inherited(arguments);
+	},
+
+	isGetMethod: function(/* String */method){
+		return !!(this._getMethods && this._getMethods[method]);
+	},
+
+	bind: function(method, parameters, deferredRequestHandler, url){
+		if(!this.isGetMethod(method)){
+			return this.inherited(arguments);
+		}
+		url = url || this.serviceUrl;
+		var def = dojo.xhrGet({
+			url: url + (url.indexOf("?") == -1 ? "?" : "&") +
+				"method=" + encodeURIComponent(method) +
+				"&params=" + encodeURIComponent(dojango.rpc.canonicalJson(parameters || [])),
+			timeout: this.timeout,
+			handleAs: "json-comment-optional"
+		});
+		def.addCallbacks(this.resultCallback(deferredRequestHandler), this.errorCallback(deferredRequestHandler));
+	}
+});
@@ -0,0 +1,79 @@
+import threading
+try:
+    from collections import OrderedDict
+except ImportError:
+    from django.utils.datastructures import SortedDict as OrderedDict
+
+__all__ = ('LRUCache',)
+
+class LRUCache(object):
+    """ A thread safe in-process cache dropping the least recently used
+        entries when it's full.
+
+        By default max_size is the maximum number of entries.  If a 'get_size'
+        function is given, every entry is weighted by get_size(value) instead
+        (ie the length of a string to limit the cache to max_size bytes):
+
+        >>> cache = LRUCache(10 * 1024 * 1024, get_size=len)
+        >>> cache.set('key', 'value')
+        >>> cache.get('key')
+        'value'
+
+        Values bigger than max_size are not cached at all.
+    """
+    def __init__(self, max_size=100, get_size=None):
+        self.max_size = max_size
+        self.get_size = get_size or (lambda value: 1)
+        self.size = 0
+        self._entries = OrderedDict() # key -> (value, size), oldest first
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            try:
+                value, size = self._entries.pop(key)
+            except KeyError:
+                return default
+            self._entries[key] = (value, size) # now it's the most recent one
+            return value
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        size = self.get_size(value)
+        self._lock.acquire()
+        try:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            if size > self.max_size:
+                return
+            while self._entries and self.size + size > self.max_size:
+                oldest = iter(self._entries).next()
+                self.size -= self._entries.pop(oldest)[1]
+            self._entries[key] = (value, size)
+            self.size += size
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self.size = 0
+        finally:
+            self._lock.release()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -41,7 +41,7 @@ class Command(BaseCommand):
         make_option('--minify_extreme', dest='minify_extreme', action="store_true", default=False,
             help='Does a dojo extreme-mini build (keeps only what is defined in build profile and all media files)'),
         make_option('--prepare_zipserve', dest='prepare_zipserve', action="store_true", default=False,
-            help='Zips everything you have built, so it can be deployed to Google AppEngine'),
+            help='Zips everything you have built (and writes a manifest of it), so it can be deployed to Google AppEngine or served by dojango.zipserve'),
     )
     help = "Builds a dojo release."
     args = '[dojo build profile name]'
@@ -281,7 +281,10 @@ see: http://dojotoolkit.org/license for details
         Creates zip packages for each dojo module within the current release folder.
         It splits the module dojox into several modules, so it fits the 1000 files limit of
         Google AppEngine.
+        Finally a manifest of all zipped files is written, that is used by
+        dojango.zipserve to answer conditional requests without reading the files.
         """
+        from dojango.zipserve import MANIFEST_NAME, write_manifest
         for folder in os.listdir(self.dojo_release_dir):
             module_dir = '%s/%s' % (self.dojo_release_dir, folder)
             if os.path.isdir(module_dir):
@@ -303,6 +306,8 @@ see: http://dojotoolkit.org/license for details
                 # now add the 
                 create_zip(module_dir, folder, module_dir + ".zip")
                 shutil.rmtree(module_dir)
+        zip_files = [os.path.join(self.dojo_release_dir, f) for f in os.listdir(self.dojo_release_dir) if f.endswith(".zip")]
+        write_manifest(zip_files, os.path.join(self.dojo_release_dir, MANIFEST_NAME))
                         
 
 def zipfolder(path, relname, archive):
@@ -0,0 +1,66 @@
+from optparse import make_option
+
+from django import VERSION as django_version
+if django_version >= (1, 5, 0):
+    import json
+else:
+    from django.utils import simplejson as json
+
+from dojango.data.modelstore.instrumentation import get_stats, get_percentile, reset_stats
+
+try:
+    from django.core.management.base import BaseCommand, CommandError
+except ImportError:
+    # Fake BaseCommand out so imports on django 0.96 don't fail.
+    BaseCommand = object
+    class CommandError(Exception):
+        pass
+
+class Command(BaseCommand):
+    '''This command shows the aggregated statistics of the servicemethod calls
+    (see dojango.data.modelstore.instrumentation). They are collected if 
+    DOJANGO_SERVICEMETHOD_STATS = True is set in your settings file:
+
+       ./manage.py servicemethodstats
+
+    The statistics are sorted by the total time spent in each method.
+    '''
+
+    option_list = BaseCommand.option_list + (
+        make_option('--json', dest='json', action="store_true", default=False,
+            help='Print the raw statistics as json.'),
+        make_option('--reset', dest='reset', action="store_true", default=False,
+            help='Reset the statistics of all processes.'),
+    )
+    help = "Shows the timing, query and payload statistics of servicemethod calls."
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            reset_stats()
+            print 'The servicemethod statistics were reset.'
+            return
+        stats = get_stats()
+        if options['json']:
+            print json.dumps(stats, indent=2)
+            return
+        if not stats:
+            print 'No servicemethod calls recorded (is DOJANGO_SERVICEMETHOD_STATS = True?)'
+            return
+        print '%-30s %7s %7s %9s %9s %9s %9s %8s %10s %10s' % ('method', 'calls', 'errors',
+            'avg ms', 'p50 ms', 'p95 ms', 'max ms', 'queries', 'req bytes', 'resp bytes')
+        methods = sorted(stats.items(), key=lambda item: -item[1]['wall_time'])
+        for name, s in methods:
+            calls = s['calls'] or 1
+            print '%-30s %7d %7d %9.1f %9s %9s %9.1f %8.1f %10d %10d' % (name, s['calls'],
+                sum(s['errors'].values()), s['wall_time'] * 1000 / calls,
+                self._format_percentile(s, 50), self._format_percentile(s, 95),
+                s['max_wall_time'] * 1000, float(s['query_count']) / calls,
+                s['request_size'] / calls, s['response_size'] / calls)
+            for exception, count in s['errors'].items():
+                print '    %s: %d' % (exception, count)
+
+    def _format_percentile(self, stats, percentile):
+        value = get_percentile(stats, percentile)
+        if value is None:
+            return stats['calls'] and '>5000' or '-'
+        return '<=%d' % value
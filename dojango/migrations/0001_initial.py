@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreChange',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('model', models.CharField(max_length=100, db_index=True)),
+                ('object_pk', models.CharField(max_length=255)),
+                ('action', models.CharField(max_length=1, choices=[('s', 'save'), ('d', 'delete')])),
+                ('changed', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -1,3 +1,23 @@
 from django.db import models
 
-# Create your models here.
+class StoreChange(models.Model):
+    """ A change log entry for a model instance that is tracked with
+        dojango.data.modelstore.track_changes().
+
+        The (ever increasing) primary key is used as the token for the
+        delta mode of the modelstore Stores.
+    """
+    ACTION_SAVE = 's'
+    ACTION_DELETE = 'd'
+    ACTION_CHOICES = (
+        (ACTION_SAVE, 'save'),
+        (ACTION_DELETE, 'delete'),
+    )
+
+    model = models.CharField(max_length=100, db_index=True) # <app_label>.<model_name>
+    object_pk = models.CharField(max_length=255)
+    action = models.CharField(max_length=1, choices=ACTION_CHOICES)
+    changed = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return u'%s__%s (%s)' % (self.model, self.object_pk, self.get_action_display())
@@ -0,0 +1,494 @@
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from StringIO import StringIO
+from decimal import Decimal
+
+from django import VERSION as django_version
+if django_version >= (1, 5, 0):
+    import json
+else:
+    from django.utils import simplejson as json
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, signals
+from django.conf.urls import url
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.test.client import RequestFactory
+from django.utils import unittest
+
+from dojango.data import QueryReadStoreInfo, JsonQueryRestStoreInfo, _parsed_queries
+from dojango.data.jsonquery import JsonQueryError, parse_filter, compile_filter
+from dojango.data.modelstore import ModelQueryStore, StoreField, JsonService, servicemethod
+from dojango.data.modelstore import notifications
+from dojango.data.modelstore.instrumentation import measure
+from dojango.data.modelstore.treestore import TreeStore
+from dojango.data.rest import JsonRestStoreView
+from dojango.models import StoreChange
+from dojango.util import msgpack, msgpack_encode, msgpack_decode, to_dojo_data
+from dojango.zipserve import ZipServer
+
+class QueryInfoConcurrencyTest(TestCase):
+    """ The extracted query state is shared between requests (see
+        QueryInfo.extract), these tests make sure it doesn't leak
+        between QueryInfo instances of concurrent requests.
+    """
+    thread_count = 8
+    calls_per_thread = 200
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        _parsed_queries.clear()
+
+    def run_threads(self, target):
+        errors = []
+        def run(n):
+            try:
+                target(n)
+            except Exception, e:
+                errors.append(e)
+        threads = [ threading.Thread(target=run, args=(n,)) for n in range(self.thread_count) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_sorting_per_instance(self):
+        def sort(n):
+            for i in range(self.calls_per_thread):
+                # half of the threads share their queries with another thread
+                field = 'field%d' % (n % (self.thread_count / 2))
+                info = QueryReadStoreInfo(self.factory.get('/', {'sort': field, 'start': i % 10}))
+                info.extract()
+                assert info.sorting == [field], (field, info.sorting)
+                # sorting again just changes this instance
+                info.params['sort'] = 'other'
+                info.set_sorting()
+                assert info.sorting == [field, 'other'], (field, info.sorting)
+        self.run_threads(sort)
+
+    def test_state_is_copied(self):
+        request = self.factory.get('/', {'sort': 'name'})
+        first = QueryReadStoreInfo(request)
+        first.extract()
+        first.sorting.append('-price')
+        first.filters['name'] = 'changed'
+
+        second = QueryReadStoreInfo(request)
+        second.extract()
+        self.assertEqual(second.sorting, ['name'])
+        self.assertEqual(second.filters, {})
+        self.assertEqual(request.GET.get('sort'), 'name')
+
+    def test_parsed_queries_bounded(self):
+        def fill(n):
+            for i in range(_parsed_queries.max_size / 2):
+                info = QueryReadStoreInfo(self.factory.get('/', {'sort': 'field%d_%d' % (n, i)}))
+                info.extract()
+        self.run_threads(fill)
+        self.assertEqual(len(_parsed_queries), _parsed_queries.max_size)
+        self.assertEqual(_parsed_queries.size, _parsed_queries.max_size)
+
+class MeasureTest(TestCase):
+    def test_save(self):
+        # Django runs inserts with 'with connection.cursor() as cursor'
+        change, stats = measure(StoreChange.objects.create, model='auth.user',
+            object_pk='1', action=StoreChange.ACTION_SAVE)
+        self.assertTrue(change.pk)
+        self.assertEqual(stats['query_count'], 1)
+        self.assertTrue(stats['query_time'] >= 0)
+        self.assertFalse('cursor' in connection.__dict__)
+
+    def test_nested(self):
+        def count():
+            return StoreChange.objects.count()
+        def outer():
+            measure(count)
+            return count()
+        self.assertEqual(measure(outer)[1]['query_count'], 2)
+
+class ChangeStore(ModelQueryStore):
+    model = StoreField()
+    object_pk = StoreField()
+
+    class Meta(object):
+        objects = StoreChange.objects.all()
+        service = JsonService()
+
+class JsonServiceTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.store = ChangeStore()
+        StoreChange.objects.create(model='auth.user', object_pk='1', action=StoreChange.ACTION_SAVE)
+
+    def post(self, data, content_type='application/json', **extra):
+        request = self.factory.post('/store/', data, content_type=content_type, **extra)
+        return self.store.service.view(request)
+
+    def test_call(self):
+        response = self.post(json.dumps({'id': 1, 'method': 'fetch', 'params': [{}, 0, 5]}))
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.content)['result']
+        self.assertEqual(result['numRows'], 1)
+        self.assertEqual(result['items'][0]['object_pk'], '1')
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack_call(self):
+        response = self.post(msgpack_encode({'id': 1, 'method': 'fetch', 'params': [{}, 0, 5]}),
+            content_type='application/msgpack', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        result = msgpack_decode(response.content)['result']
+        self.assertEqual(result['numRows'], 1)
+
+    def test_batch(self):
+        response = self.post(json.dumps([
+            {'id': 1, 'method': 'fetch', 'params': [{}, 0, 5]},
+            {'id': 2, 'method': 'unknown'},
+            {'id': 3},
+            5,
+        ]))
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)
+        self.assertEqual([ r['id'] for r in results ], [1, 2, 0, 0])
+        self.assertEqual(results[0]['error'], None)
+        self.assertEqual(results[0]['result']['numRows'], 1)
+        self.assertEqual(results[1]['error']['message'], 'Unknown method: "unknown"')
+        for result in results[2:]:
+            self.assertEqual(result['error']['message'], 'Invalid JSON-RPC request')
+
+    def test_invalid_requests(self):
+        error = json.loads(self.post('[]').content)['error']
+        self.assertEqual(error['message'], 'Invalid JSON-RPC request: empty batch')
+        error = json.loads(self.post('{"id": 1, ').content)['error']
+        self.assertEqual(error['message'], 'Invalid JSON-RPC request')
+
+class MemoizeTest(TestCase):
+    def test_deferred_key(self):
+        # objects of .only() are instances of a deferred class
+        change = StoreChange.objects.create(model='auth.user', object_pk='1',
+            action=StoreChange.ACTION_SAVE)
+        deferred = StoreChange.objects.only('model').get(pk=change.pk)
+        store = ChangeStore()
+        field = store.get_option('fields')['object_pk']
+        self.assertEqual(field.get_memoize_key(deferred, store), field.get_memoize_key(change, store))
+
+class MsgpackTest(unittest.TestCase):
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_strings(self):
+        # byte strings must not be packed as binary, clients expect strings
+        data = msgpack.unpackb(msgpack_encode({'items': [{'name': 'x', 'price': Decimal('1.5')}],
+            'tuple': ('a',), 'label': u'name'}), raw=False)
+        self.assertEqual(data, {u'items': [{u'name': u'x', u'price': u'1.5'}],
+            u'tuple': [u'a'], u'label': u'name'})
+        for key in data.keys() + data['items'][0].keys():
+            self.assertTrue(isinstance(key, unicode))
+        for value in data['items'][0].values() + data['tuple']:
+            self.assertTrue(isinstance(value, unicode))
+
+def expand_columnar(data):
+    # what dojango.data.expandColumnar does on the client
+    missing = data.get('missing', {})
+    items = []
+    for i, row in enumerate(data['rows']):
+        absent = missing.get(str(i), [])
+        item = {}
+        for j, column in enumerate(data['columns']):
+            value = row[j]
+            if j in absent:
+                continue
+            if column in data['references'] and value is not None:
+                if isinstance(value, list):
+                    value = [{'_reference': v} for v in value]
+                else:
+                    value = {'_reference': value}
+            item[column] = value
+        items.append(item)
+    return items
+
+class ColumnarTest(unittest.TestCase):
+    def test_round_trip(self):
+        items = [
+            {'id': 1, 'name': 'Lenin', 'country': {'_reference': 'ru'}, 'alias': None},
+            {'id': 2, 'name': None, 'country': None},
+            {'id': 3, 'country': {'_reference': 'de'}, 'alias': 'x'},
+        ]
+        data = json.loads(json.dumps(to_dojo_data(items, columnar=True)))
+        self.assertEqual(data['references'], ['country'])
+        self.assertEqual(expand_columnar(data), items)
+        # nothing is missing -- no "missing"
+        self.assertFalse('missing' in to_dojo_data(items[:1], columnar=True))
+
+def load_json(content):
+    if content.startswith('{}&&'): # DOJANGO_DOJO_SECURE_JSON
+        content = content[4:]
+    return json.loads(content)
+
+class JsonRestStoreViewTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.view = JsonRestStoreView(StoreChange.objects.all(), fields=['model', 'object_pk'])
+        for i in range(5):
+            StoreChange.objects.create(model='auth.user', object_pk=str(i),
+                action=StoreChange.ACTION_SAVE)
+        StoreChange.objects.create(model='auth.group', object_pk='9',
+            action=StoreChange.ACTION_DELETE)
+
+    def get(self, view=None, **params):
+        response = (view or self.view)(self.factory.get('/changes/', params))
+        self.assertEqual(response.status_code, 200)
+        return load_json(response.content)
+
+    def test_filters(self):
+        self.assertEqual(len(self.get(model='auth.group')), 1)
+        self.assertEqual(len(self.get(model__startswith='auth.')), 6)
+        self.assertEqual(len(self.get(object_pk__in='1,2,9')), 3)
+        # not serialized, unknown lookups and other parameters are ignored
+        self.assertEqual(len(self.get(action='d')), 6)
+        self.assertEqual(len(self.get(model__regex='group')), 6)
+        self.assertEqual(len(self.get(model__startswith__x='auth')), 6)
+        self.assertEqual(len(self.get(_='123')), 6)
+
+    @unittest.skipUnless('django.contrib.auth' in settings.INSTALLED_APPS, 'needs django.contrib.auth')
+    def test_no_relations(self):
+        from django.contrib.auth.models import Permission
+        view = JsonRestStoreView(Permission.objects.all(), fields=['codename', 'content_type'],
+            max_count=1000)
+        count = Permission.objects.count()
+        self.assertEqual(len(self.get(view, content_type__model='nothing')), count)
+        self.assertEqual(len(self.get(view, content_type__app_label__startswith='x')), count)
+
+class JsonRestStoreBulkSaveTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.view = JsonRestStoreView(StoreChange.objects.all(),
+            fields=['model', 'object_pk', 'changed'])
+        self.changes = [ StoreChange.objects.create(model='auth.user', object_pk=str(i),
+            action=StoreChange.ACTION_SAVE) for i in range(3) ]
+        self.saved = []
+        signals.post_save.connect(self.post_save, sender=StoreChange)
+
+    def tearDown(self):
+        signals.post_save.disconnect(self.post_save, sender=StoreChange)
+
+    def post_save(self, sender, instance, created, **kwargs):
+        self.saved.append((instance.pk, created))
+
+    def send(self, data, method='post', id=None):
+        request = getattr(self.factory, method)('/changes/', json.dumps(data),
+            content_type='application/json')
+        return self.view(request, id)
+
+    def test_update(self):
+        first, second = self.changes[:2]
+        response = self.send([{'id': first.pk, 'object_pk': 'a'}, {'id': second.pk, 'object_pk': 'b'},
+            {'model': 'auth.group', 'object_pk': 'c', 'action': 's'}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StoreChange.objects.get(pk=first.pk).object_pk, 'a')
+        self.assertEqual(StoreChange.objects.get(pk=second.pk).object_pk, 'b')
+        # auto_now fields are set like save() would
+        self.assertTrue(StoreChange.objects.get(pk=first.pk).changed > first.changed)
+        self.assertEqual(StoreChange.objects.filter(object_pk='c').count(), 1)
+        # save signals are sent for the bulk updated objects
+        self.assertEqual(sorted(self.saved)[:2], [(first.pk, False), (second.pk, False)])
+        self.assertEqual(len(self.saved), 3)
+
+    def test_invalid_items(self):
+        self.assertEqual(self.send([1, 2]).status_code, 400)
+        self.assertEqual(self.send({'save': {'id': 1}}).status_code, 400)
+        self.assertEqual(self.send(['x'], 'put', self.changes[0].pk).status_code, 400)
+        self.assertEqual(self.saved, [])
+
+    def test_field_errors(self):
+        response = self.send({'changed': 'no date'}, 'put', self.changes[0].pk)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(load_json(response.content)['errors'].keys(), ['changed'])
+
+class NotifiedStore(ModelQueryStore):
+    model = StoreField()
+
+    @servicemethod
+    def notify(self, request, tag):
+        NotificationTest.calls.append((tag, self.get_option('objects')))
+        NotificationTest.done.set()
+
+    class Meta(object):
+        objects = StoreChange.objects.none()
+        service = JsonService()
+
+user_changes = NotifiedStore(objects=StoreChange.objects.filter(model='auth.user'))
+group_changes = NotifiedStore(objects=StoreChange.objects.filter(model='auth.group'))
+
+class ChangeTree(TreeStore):
+    """ Just used to look up nodes, StoreChange has no parent field """
+    model = StoreField()
+
+    class Meta(object):
+        objects = StoreChange.objects.filter(model='auth.user')
+        parent_field = 'parent'
+
+urlpatterns = [
+    url(r'^users/$', user_changes.service.view),
+    url(r'^groups/$', group_changes),
+    url(r'^tree/$', ChangeTree().view),
+]
+
+@override_settings(ROOT_URLCONF='dojango.tests')
+class NotificationTest(TestCase):
+    calls = []
+    done = threading.Event()
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        NotificationTest.calls = []
+        notifications._services.clear()
+
+    def notify(self, path, store, tag):
+        NotificationTest.done.clear()
+        request = self.factory.post(path, json.dumps({'method': 'notify', 'params': [tag]}),
+            content_type='application/json')
+        self.assertEqual(store.service.view(request).status_code, 204)
+        self.assertTrue(NotificationTest.done.wait(5))
+
+    def test_store_per_url(self):
+        # the same Store class is mounted twice with other objects
+        self.notify('/users/', user_changes, 'u')
+        self.notify('/groups/', group_changes, 'g')
+        self.assertEqual(self.calls, [('u', user_changes.get_option('objects')),
+            ('g', group_changes.get_option('objects'))])
+
+    def test_serialized_job(self):
+        # a worker in another process resolves the service with the URLconf
+        for path, store in (('/users/', user_changes), ('/groups/', group_changes)):
+            job = notifications.NotificationJob(path, 'notify', [path])
+            notifications.NotificationJob.from_dict(json.loads(json.dumps(job.to_dict())))()
+        self.assertEqual(self.calls, [('/users/', user_changes.get_option('objects')),
+            ('/groups/', group_changes.get_option('objects'))])
+        self.assertRaises(ValueError, notifications.get_service, '/unknown/')
+
+@override_settings(ROOT_URLCONF='dojango.tests')
+class TreeStoreNodeTest(TestCase):
+    def test_invalid_nodes(self):
+        StoreChange.objects.create(model='auth.user', object_pk='1', action=StoreChange.ACTION_SAVE)
+        other = StoreChange.objects.create(model='auth.group', object_pk='1',
+            action=StoreChange.ACTION_SAVE)
+        self.assertEqual(self.client.get('/tree/', {'node': 'bogus'}).status_code, 400)
+        self.assertEqual(self.client.get('/tree/', {'node': 'auth.user__1'}).status_code, 400)
+        self.assertEqual(self.client.get('/tree/', {'node': 'dojango.storechange__x'}).status_code, 400)
+        self.assertEqual(self.client.get('/tree/', {'node': 'dojango.storechange__999'}).status_code, 404)
+        # rows that aren't objects of the store can't be expanded
+        self.assertEqual(self.client.get('/tree/', {'node': 'dojango.storechange__%s' % other.pk}).status_code, 404)
+
+class JsonQueryTest(unittest.TestCase):
+    def test_precedence(self):
+        # & binds tighter than |
+        self.assertEqual(parse_filter("?(@.a=1|@.b=2&@.c=3)"), ('or', [('cmp', 'a', '=', 1),
+            ('and', [('cmp', 'b', '=', 2), ('cmp', 'c', '=', 3)])]))
+        self.assertEqual(parse_filter("(@.a=1|@.b=2)&@['c']=='x'"), ('and', [
+            ('or', [('cmp', 'a', '=', 1), ('cmp', 'b', '=', 2)]), ('cmp', 'c', '=', 'x')]))
+        self.assertEqual(parse_filter("?author.name~'bil*'"), ('cmp', 'author.name', '~', 'bil*'))
+
+    def test_compile(self):
+        q = compile_filter(parse_filter("@.name='Bil*'&(@.city~'*shire*'|@.age>=111)&@.x!=null"),
+            ['name', 'city', 'age', 'x'])
+        self.assertEqual(str(q), str(Q(name__startswith='Bil') &
+            (Q(city__icontains='shire') | Q(age__gte=111)) & ~Q(x__isnull=True)))
+        self.assertEqual(str(compile_filter(parse_filter("@.name='B?l'"), ['name'])),
+            str(Q(name__regex='^B.l$')))
+
+    def test_malformed(self):
+        for expression in ("@.a=", "@.a=1&", "(@.a=1", "@.a=1)", "@.a 1", "@.a=@.b",
+                           "@.a='x", "@.a=1 @.b=2", "@.a=1;drop"):
+            self.assertRaises(JsonQueryError, parse_filter, expression)
+        # just the allowed fields
+        self.assertRaises(JsonQueryError, compile_filter, parse_filter("@.password='x'"), ['name'])
+        self.assertRaises(JsonQueryError, compile_filter, parse_filter("@.user.password='x'"), ['user'])
+
+class JsonQueryRestStoreInfoTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        for i in range(5):
+            StoreChange.objects.create(model='auth.user', object_pk=str(i),
+                action=i % 2 and StoreChange.ACTION_SAVE or StoreChange.ACTION_DELETE)
+
+    def process(self, jsonpath, max_count=25):
+        # the ? of the filter has to be escaped, it would start the query string
+        info = JsonQueryRestStoreInfo(self.factory.get('/changes/' + jsonpath.replace('?', '%3F')),
+            max_count=max_count)
+        info.extract()
+        return [ change.object_pk for change in info.process(StoreChange.objects.all()) ]
+
+    def test_sorting(self):
+        self.assertEqual(self.process("[\\@['object_pk']]"), ['4', '3', '2', '1', '0'])
+        self.assertEqual(self.process("[/@['action'],\\@['object_pk']]"), ['4', '2', '0', '3', '1'])
+
+    def test_paging(self):
+        self.assertEqual(self.process("[/@['object_pk']][1:2]"), ['1', '2'])
+        self.assertEqual(self.process("[/@['object_pk']][3:]"), ['3', '4'])
+        # not more than max_count objects
+        self.assertEqual(self.process("[/@['object_pk']][0:10]", max_count=2), ['0', '1'])
+
+    def test_filter(self):
+        self.assertEqual(self.process("[?(@.object_pk>'2'|@.action='d')][/@['object_pk']][0:10]"),
+            ['0', '2', '3', '4'])
+        self.assertRaises(JsonQueryError, self.process, "[?(@.object_pk=)]")
+
+class ZipServerTest(unittest.TestCase):
+    content = 'dojo.provide("dojo.foo");\n' * 100
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        filename = os.path.join(self.dir, 'dojo.zip')
+        archive = zipfile.ZipFile(filename, 'w')
+        archive.writestr(zipfile.ZipInfo('dojo/foo.js', (2012, 1, 1, 0, 0, 0)), self.content,
+            zipfile.ZIP_DEFLATED)
+        archive.writestr(zipfile.ZipInfo('dojo/bar.png', (2012, 1, 1, 0, 0, 0)), 'PNG')
+        archive.close()
+        self.server = ZipServer([filename])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def serve(self, name, **kwargs):
+        status, headers, body = self.server.serve(name, **kwargs)
+        return status, dict(headers), body
+
+    def test_gzip(self):
+        status, headers, body = self.serve('dojo/foo.js')
+        self.assertEqual((status, body), (200, self.content))
+        self.assertFalse('Content-Encoding' in headers)
+
+        status, gzip_headers, body = self.serve('dojo/foo.js', accept_encoding='deflate, gzip')
+        self.assertEqual(gzip_headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(body)).read(), self.content)
+        self.assertEqual(gzip_headers['Content-Length'], str(len(body)))
+        self.assertNotEqual(gzip_headers['ETag'], headers['ETag'])
+
+        self.assertFalse('Content-Encoding' in self.serve('dojo/foo.js', accept_encoding='gzip;q=0')[1])
+        # stored files are sent as they are
+        status, headers, body = self.serve('dojo/bar.png', accept_encoding='gzip')
+        self.assertEqual(body, 'PNG')
+        self.assertFalse('Content-Encoding' in headers)
+
+    def test_etag(self):
+        etag = self.serve('dojo/foo.js')[1]['ETag']
+        gzip_etag = self.serve('dojo/foo.js', accept_encoding='gzip')[1]['ETag']
+        for if_none_match in (etag, '"other", %s' % etag, 'W/%s' % etag, '*'):
+            self.assertEqual(self.serve('dojo/foo.js', if_none_match=if_none_match)[0], 304)
+        self.assertEqual(self.serve('dojo/foo.js', if_none_match='"other"')[0], 200)
+        # the gzip encoded response is another entity
+        self.assertEqual(self.serve('dojo/foo.js', if_none_match=gzip_etag)[0], 200)
+        self.assertEqual(self.serve('dojo/foo.js', if_none_match=gzip_etag, accept_encoding='gzip')[0], 304)
+
+    def test_django_view(self):
+        request = RequestFactory().get('/media/dojo/foo.js', HTTP_ACCEPT_ENCODING='gzip')
+        response = self.server.django_view(request, 'dojo/foo.js')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        request = RequestFactory().get('/media/dojo/foo.js', HTTP_IF_NONE_MATCH=response['ETag'],
+            HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(self.server.django_view(request, 'dojo/foo.js').status_code, 304)
+        self.assertEqual(self.server.django_view(request, 'dojo/missing.js').status_code, 404)
@@ -27,6 +27,15 @@ except:
     appengine = None
     ObjectId = None
 
+try:
+    # optional binary encoding of responses, msgpack falls back to its
+    # pure python implementation if the C extension isn't available
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_CONTENT_TYPES = ('application/msgpack', 'application/x-msgpack')
+
 try:
     # this is just available since django version 1.0
     # google appengine does not provide this function yet!
@@ -109,13 +118,20 @@ def json_encode(data):
     had been added to an object dynamically are being ignored (and it also has 
     problems with some models).
     """
+    return json.dumps(encode_prepare(data), cls=DateTimeAwareJSONEncoder)
+
+def encode_prepare(data):
+    """
+    Converts the data (models, querysets, dates, ...) into plain python types
+    that can be encoded by json_encode and msgpack_encode.
+    """
 
     def _any(data):
         ret = None
         # Opps, we used to check if it is of type list, but that fails 
         # i.e. in the case of django.newforms.utils.ErrorList, which extends
         # the type "list". Oh man, that was a dumb mistake!
-        if isinstance(data, list):
+        if isinstance(data, (list, tuple)):
             ret = _list(data)
         # Same as for lists above.
         elif appengine and isinstance(data, appengine.ext.db.Query):
@@ -124,7 +140,7 @@ def json_encode(data):
             ret = _dict(data)
         elif isinstance(data, Decimal):
             # json.dumps() cant handle Decimal
-            ret = str(data)
+            ret = unicode(data)
         elif isinstance(data, QuerySet):
             # Actually its the same as a list ...
             ret = _list(data)
@@ -133,7 +149,7 @@ def json_encode(data):
         elif appengine and isinstance(data, appengine.ext.db.Model):
             ret = _googleModel(data)
         elif ObjectId and isinstance(data, ObjectId):
-            ret = str(data)
+            ret = unicode(data)
         # here we need to encode the string as unicode (otherwise we get utf-16 in the json-response)
         elif isinstance(data, basestring):
             ret = unicode(data)
@@ -143,15 +159,21 @@ def json_encode(data):
         elif isinstance(data, datetime.datetime):
             # For dojo.date.stamp we convert the dates to use 'T' as separator instead of space
             # i.e. 2008-01-01T10:10:10 instead of 2008-01-01 10:10:10
-            ret = str(data).replace(' ', 'T')
+            ret = unicode(data).replace(u' ', u'T')
         elif isinstance(data, datetime.date):
-            ret = str(data)
+            ret = unicode(data)
         elif isinstance(data, datetime.time):
-            ret = "T" + str(data)
+            ret = u"T" + unicode(data)
         else:
             # always fallback to a string!
             ret = data
         return ret
+
+    def _key(key):
+        # keys are unicode as well, MessagePack would send byte strings as binary
+        if isinstance(key, str):
+            return force_unicode(key)
+        return key
     
     def _model(data):
         ret = {}
@@ -159,22 +181,22 @@ def json_encode(data):
         for f in data._meta.fields:
             # special FileField handling (they can't be json serialized)
             if isinstance(f, ImageField) or isinstance(f, FileField):
-                ret[f.attname] = unicode(getattr(data, f.attname))
+                ret[_key(f.attname)] = unicode(getattr(data, f.attname))
             else:
-                ret[f.attname] = _any(getattr(data, f.attname))
+                ret[_key(f.attname)] = _any(getattr(data, f.attname))
         # And additionally encode arbitrary properties that had been added.
         fields = dir(data.__class__) + ret.keys()
         # ignoring _state and delete properties
         add_ons = [k for k in dir(data) if k not in fields and k not in ('delete', '_state',)]
         for k in add_ons:
-            ret[k] = _any(getattr(data, k))
+            ret[_key(k)] = _any(getattr(data, k))
         return ret
 
     def _googleModel(data):
         ret = {}
-        ret['id'] = data.key().id()
+        ret[u'id'] = data.key().id()
         for f in data.fields():
-            ret[f] = _any(getattr(data, f))
+            ret[_key(f)] = _any(getattr(data, f))
         return ret
 
     def _list(data):
@@ -186,11 +208,95 @@ def json_encode(data):
     def _dict(data):
         ret = {}
         for k,v in data.items():
-            ret[k] = _any(v)
+            ret[_key(k)] = _any(v)
         return ret
     
-    ret = _any(data)
-    return json.dumps(ret, cls=DateTimeAwareJSONEncoder)
+    return _any(data)
+
+def msgpack_encode(data):
+    """
+    Encodes the data as MessagePack using the same type conversions as json_encode.
+    Raises an ImportError if the msgpack package is not installed.
+    """
+    if msgpack is None:
+        raise ImportError("Install the msgpack package to use the MessagePack encoding")
+    # types that are left over (i.e. dates within tuples) are handled like in json_encode
+    encoder = DateTimeAwareJSONEncoder()
+    return msgpack.packb(encode_prepare(data), default=encoder.default, use_bin_type=True)
+
+def msgpack_decode(msgpack_string):
+    """
+    The MessagePack counterpart of json_decode.
+    """
+    if msgpack is None:
+        raise ImportError("Install the msgpack package to use the MessagePack encoding")
+    return msgpack.unpackb(msgpack_string, raw=False)
+
+def parse_accept(accept):
+    """
+    Parses an Accept header into a dict mapping the (lowercased) media ranges
+    to their quality, i.e. 'application/msgpack, application/json;q=0.5'
+    results in {'application/msgpack': 1.0, 'application/json': 0.5}
+    """
+    ranges = {}
+    for media_range in (accept or '').split(','):
+        params = media_range.split(';')
+        media_type = params[0].strip().lower()
+        if not media_type:
+            continue
+        quality = 1.0
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        ranges[media_type] = max(quality, ranges.get(media_type, 0.0))
+    return ranges
+
+def accepts_msgpack(request):
+    """
+    Did the client ask for a MessagePack encoded response (Accept: application/msgpack)?
+    It has to be listed explicitly (wildcards don't count), with a quality above 0 that
+    isn't lower than the one of application/json.
+    Always False if the msgpack package is not installed.
+    """
+    if msgpack is None or request is None:
+        return False
+    ranges = parse_accept(request.META.get('HTTP_ACCEPT', ''))
+    quality = max([ ranges.get(content_type, 0.0) for content_type in MSGPACK_CONTENT_TYPES ])
+    return quality > 0 and quality >= ranges.get('application/json', 0.0)
+
+def is_msgpack_request(request):
+    """
+    Was the request body sent MessagePack encoded?
+    """
+    content_type = request.META.get('CONTENT_TYPE', '').split(';')[0].strip()
+    return msgpack is not None and content_type in MSGPACK_CONTENT_TYPES
+
+def to_msgpack_response(data):
+    """
+    The MessagePack counterpart of to_json_response.
+    """
+    ret = HttpResponse(msgpack_encode(data), content_type=MSGPACK_CONTENT_TYPES[0])
+    ret['Vary'] = "Accept"
+    ret['Pragma'] = "no-cache"
+    ret['Cache-Control'] = "must-revalidate"
+    return ret
+
+def to_negotiated_response(data, request):
+    """
+    Returns an HttpResponse of the data encoded as plain Json, or as MessagePack
+    if the client accepts it (see accepts_msgpack).  Unlike to_json_response
+    the response doesn't forbid caching and the Json isn't prefixed.
+    """
+    if accepts_msgpack(request):
+        ret = HttpResponse(msgpack_encode(data), content_type=MSGPACK_CONTENT_TYPES[0])
+    else:
+        ret = HttpResponse(json.dumps(data), content_type="application/json")
+    ret['Vary'] = "Accept"
+    return ret
 
 def json_decode(json_string):
     """
@@ -200,12 +306,16 @@ def json_decode(json_string):
     """
     return json.loads(json_string)
     
-def to_json_response(data, func_name=None, use_iframe=False):
+def to_json_response(data, func_name=None, use_iframe=False, request=None):
     """
     This functions creates a http response object. It mainly set the right
     headers for you.
     If you pass a func_name to it, it'll surround the json data with a function name.
+    If you pass the request and the client accepts MessagePack (and the msgpack package
+    is installed), the data is sent MessagePack encoded instead.
     """
+    if not func_name and not use_iframe and accepts_msgpack(request):
+        return to_msgpack_response(data)
     data = json_encode(data)
     # as of dojo version 1.2.0, prepending {}&&\n is the most secure way!!!
     # for dojo version < 1.2.0 you have to set DOJANGO_DOJO_SECURE_JSON = False
@@ -224,9 +334,11 @@ def to_json_response(data, func_name=None, use_iframe=False):
     ret['Pragma'] = "no-cache"
     ret['Cache-Control'] = "must-revalidate"
     ret['If-Modified-Since'] = str(datetime.datetime.now())
+    if request is not None:
+        ret['Vary'] = "Accept"
     return ret
 
-def to_dojo_data(items, identifier='id', num_rows=None):
+def to_dojo_data(items, identifier='id', num_rows=None, columnar=False):
     """Return the data as the dojo.data API defines.
     The dojo.data API expects the data like so:
     {identifier:"whatever",
@@ -235,12 +347,80 @@ def to_dojo_data(items, identifier='id', num_rows=None):
      ]
     }
     The identifier is optional.
+    If columnar is True, the items are converted into the compact columnar
+    format (see to_columnar).
     """
     ret = {'items':items}
     if identifier:
         ret['identifier'] = identifier
     if num_rows:
         ret['numRows'] = num_rows
+    if columnar:
+        ret = to_columnar(ret)
+    return ret
+
+def _is_reference(value):
+    """Is the value a {'_reference': ...} item (or a list of them)?"""
+    if isinstance(value, dict):
+        return value.keys() == ['_reference']
+    if isinstance(value, list):
+        for v in value:
+            if not _is_reference(v):
+                return False
+        return True
+    return False
+
+def _compact_reference(value):
+    if isinstance(value, list):
+        return [v['_reference'] for v in value]
+    return value['_reference']
+
+def to_columnar(data):
+    """Converts dojo.data compatible data (as returned by to_dojo_data) into
+    a compact columnar format, where the key names are not repeated within
+    every item:
+    {identifier:"whatever",
+     format: "columnar",
+     columns: ["name", "id", "country"],
+     references: ["country"],
+     rows: [
+         ["Lenin", 3, "ru"],
+     ]
+    }
+    The columns listed in references just contain the identifier (or a list of
+    identifiers) instead of the {_reference: ...} items. Attributes an item
+    doesn't have are sent as null as well, but listed in "missing" (row index
+    -> column indexes, just there if an item lacks an attribute), so they can
+    be told apart from null values.
+    Use dojango.data.ColumnarReadStore on the client side to read it.
+    """
+    items = data['items']
+    columns = []
+    index = {}
+    for item in items:
+        for key in item:
+            if key not in index:
+                index[key] = len(columns)
+                columns.append(key)
+    rows = [[item.get(key, None) for key in columns] for item in items]
+    missing = {}
+    for i, item in enumerate(items):
+        absent = [j for j, key in enumerate(columns) if key not in item]
+        if absent:
+            missing[i] = absent
+    # a column is sent compactly if all its values are references
+    references = []
+    for i, key in enumerate(columns):
+        values = [row[i] for row in rows if row[i] is not None]
+        if values and not [v for v in values if not _is_reference(v)]:
+            references.append(key)
+            for row in rows:
+                if row[i] is not None:
+                    row[i] = _compact_reference(row[i])
+    ret = dict([(k, v) for k, v in data.items() if k != 'items'])
+    ret.update({'format': 'columnar', 'columns': columns, 'references': references, 'rows': rows})
+    if missing:
+        ret['missing'] = missing
     return ret
 
 def is_number(s):
@@ -4,8 +4,9 @@ get_model = apps.get_model
 from django.db import models
 from django.shortcuts import render_to_response
 from django.conf import settings
+from django.http import HttpResponseForbidden
 
-from dojango.util import to_dojo_data, json_encode
+from dojango.util import to_dojo_data, json_encode, to_json_response
 from dojango.decorators import json_response
 from dojango.util import to_dojo_data
 from dojango.util.form import get_combobox_data
@@ -14,7 +15,7 @@ from dojango.util.perms import access_model, access_model_field
 import operator
     
 # prof included for people using http://www.djangosnippets.org/snippets/186/
-AVAILABLE_OPTS =  ('search_fields','prof','inclusions','sort','search','count','order','start')
+AVAILABLE_OPTS =  ('search_fields','prof','inclusions','sort','search','count','order','start','fields','format')
 
 @json_response
 def datagrid_list(request, app_name, model_name, access_model_callback=access_model, access_field_callback=access_model_field):
@@ -22,7 +23,7 @@ def datagrid_list(request, app_name, model_name, access_model_callback=access_mo
     Renders a json representation of a model within an app.  Set to handle GET params passed
     by dojos ReadQueryStore for the dojango datagrid.  The following GET params are handled with
     specially:
-      'search_fields','inclusions','sort','search','count','order','start'
+      'search_fields','inclusions','sort','search','count','order','start','fields','format'
       
     search_fields: list of fields for model to equal the search, each OR'd together.
     search: see search_fields
@@ -30,6 +31,9 @@ def datagrid_list(request, app_name, model_name, access_model_callback=access_mo
     count: sets limit
     start: sets offset
     inclusions: list of functions in the model that will be called and result added to JSON
+    fields: comma separated list of fields (sparse fieldset) the result is restricted to,
+            only these columns (and the primary key) are fetched from the database
+    format: pass "columnar" to get the compact columnar format (see dojango.util.to_columnar)
      
     any other GET param will be added to the filter on the model to determine what gets returned.  ie
     a GET param of id__gt=5 will result in the equivalent of model.objects.all().filter( id__gt=5 )
@@ -72,6 +76,15 @@ def datagrid_list(request, app_name, model_name, access_model_callback=access_mo
 		elif request.GET.has_key('sort'):
 			target =  sorted(target, lambda x,y: cmp(getattr(x,request.GET["sort"])(),getattr(y,request.GET["sort"])()));
     
+
+    # restrict the result (and the fetched columns) to the sparse fieldset
+    fieldset = None
+    if request.GET.has_key('fields'):
+        fieldset = [ f.strip() for f in request.GET['fields'].split(',') if f.strip() ]
+        fieldset.append(model._meta.pk.attname)
+        # inclusions call model methods, which may read any column
+        if hasattr(target, 'only') and not request.GET.get('inclusions'):
+            target = target.only(*[ f.name for f in model._meta.fields if f.name in fieldset or f.attname in fieldset ])
     
     # get only the limit number of models with a given offset
     target=target[int(request.GET['start']):int(request.GET['start'])+int(request.GET['count'])]
@@ -82,13 +95,18 @@ def datagrid_list(request, app_name, model_name, access_model_callback=access_mo
         if access_model_callback(app_name, model_name, request, data):   
             ret = {}
             for f in data._meta.fields:
+                if fieldset is not None and f.name not in fieldset and f.attname not in fieldset:
+                    continue
                 if access_field_callback(app_name, model_name, f.attname, request, data):
                     if isinstance(f, models.ImageField) or isinstance(f, models.FileField): # filefields can't be json serialized
                         ret[f.attname] = unicode(getattr(data, f.attname))
                     else:
                         ret[f.attname] = getattr(data, f.attname) #json_encode() this?
             fields = dir(data.__class__) + ret.keys()
-            add_ons = [k for k in dir(data) if k not in fields and access_field_callback(app_name, model_name, k, request, data)]
+            if fieldset is not None:
+                add_ons = [k for k in fieldset if k not in fields and hasattr(data, k) and access_field_callback(app_name, model_name, k, request, data)]
+            else:
+                add_ons = [k for k in dir(data) if k not in fields and access_field_callback(app_name, model_name, k, request, data)]
             for k in add_ons:
                 ret[k] = getattr(data, k)
             if request.GET.has_key('inclusions'):
@@ -105,7 +123,23 @@ def datagrid_list(request, app_name, model_name, access_model_callback=access_mo
             complete.append(ret)
         else:
             raise Exception, "You're not allowed to query the model '%s.%s' (add it to the array of the DOJANGO_DATAGRID_ACCESS setting)" % (model_name, app_name)
-    return to_dojo_data(complete, identifier=model._meta.pk.name, num_rows=num)
+    return to_dojo_data(complete, identifier=model._meta.pk.name, num_rows=num,
+                        columnar=request.GET.get('format') == 'columnar')
+
+def servicemethod_stats(request):
+    """
+    Returns the aggregated servicemethod statistics as json (see
+    dojango.data.modelstore.instrumentation), just for staff members.
+    Add it to your URLConf if you need it:
+
+        url(r'^servicemethod-stats/$', 'dojango.views.servicemethod_stats')
+    """
+    from dojango.data.modelstore.instrumentation import get_stats, reset_stats
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    if request.method == 'POST' and request.POST.get('reset'):
+        reset_stats()
+    return to_json_response(get_stats(), request=request)
 
 ###########
 #  Tests  #
@@ -0,0 +1,463 @@
+""" Serving static files (ie a dojo build prepared with
+    ./manage.py dojobuild --prepare_zipserve) out of zip archives.
+
+    It works like dojango.appengine.memcache_zipserve.MemcachedZipHandler,
+    but doesn't depend on App Engine: a ZipServer can be used as Django
+    view or as WSGI application.  The served files are kept in a size-bounded
+    in-process LRU cache (and optionally in the Django cache as second tier),
+    the zip archives are opened once per process.
+
+    As Django view:
+
+    >>> release = ZipServer(['/path/to/release/dojo.zip', '/path/to/release/dijit.zip'], max_age=31536000)
+    >>> url(r'^dojango/media/release/1.6.0/(?P<path>.*)$', release.django_view)
+
+    As WSGI application (the requested path is taken from PATH_INFO):
+
+    >>> application = ZipServer(zip_files).wsgi_app
+
+    './manage.py dojobuild --prepare_zipserve' also writes a manifest
+    (zipserve.json) of all zipped files with their archive, CRC32, size,
+    modification time and mimetype.  If it is passed to the server,
+    conditional requests are answered without touching the archives and
+    unknown files without searching them:
+
+    >>> release = ZipServer(zip_files, manifest='/path/to/release/zipserve.json')
+
+    Deflated files are sent gzip encoded to clients accepting it: the
+    compressed data of the archive is wrapped in a gzip header and trailer
+    (the CRC32 and size are in the zip directory), so nothing is
+    decompressed or compressed again.
+
+    create_server(release_dir) builds a server of all archives (and the
+    manifest, if there is one) within a release folder.
+
+    The module doesn't need a configured Django environment (just
+    django_view and the cache_timeout option use Django), so it can serve
+    a WSGI application without Django settings.
+"""
+
+import calendar
+import datetime
+import email.Utils
+import logging
+import mimetypes
+import os
+import struct
+import threading
+import time
+import zipfile
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+try:
+    import json
+except ImportError:
+    from django.utils import simplejson as json
+
+from dojango.lru import LRUCache
+
+__all__ = ('ZipServer', 'FileInfo', 'MANIFEST_NAME', 'get_etag', 'etag_matches',
+            'accepts_gzip', 'build_manifest', 'write_manifest', 'load_manifest', 'create_server')
+
+MANIFEST_NAME = 'zipserve.json'
+
+def get_etag(crc, size):
+    """ The ETag of a zipped file, built of the CRC32 and size stored in the
+        zip directory (so the file doesn't have to be read and hashed)
+    """
+    return '"%08x-%x"' % (crc & 0xffffffff, size)
+
+def etag_matches(etag, if_none_match):
+    """ Whether the If-None-Match header (a list of ETags or '*') matches
+        the ETag, weak ETags (W/"...") match as well (RFC 7232 3.2)
+    """
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return True
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+def accepts_gzip(accept_encoding):
+    """ Whether the Accept-Encoding header allows a gzip encoded response
+    """
+    for coding in (accept_encoding or '').split(','):
+        params = coding.strip().split(';')
+        if params[0].strip().lower() in ('gzip', 'x-gzip', '*'):
+            for param in params[1:]:
+                name, _, value = param.partition('=')
+                if name.strip() == 'q':
+                    try:
+                        return float(value) > 0
+                    except ValueError:
+                        return False
+            return True
+    return False
+
+class FileInfo(object):
+    """ The metadata of a file served from a zip archive
+    """
+    def __init__(self, archive, crc, size, lastmod, mimetype=None, deflated=False):
+        self.archive = archive # the file name of the archive
+        self.crc = crc
+        self.size = size
+        self.lastmod = lastmod # datetime (UTC)
+        self.mimetype = mimetype or 'application/octet-stream'
+        self.deflated = deflated # whether it's stored with ZIP_DEFLATED
+        self.etag = get_etag(crc, size)
+        self.gzip_etag = self.etag[:-1] + '-gzip"' # the gzip encoded response is another entity
+
+    @classmethod
+    def from_zipinfo(cls, archive, info):
+        return cls(archive, info.CRC, info.file_size, datetime.datetime(*info.date_time),
+                   mimetypes.guess_type(info.filename)[0], info.compress_type == zipfile.ZIP_DEFLATED)
+
+def compare_filenames(file1, file2):
+    """ Determines whether file1 is lexigraphically 'before' file2 in a
+        depth-first traversal (parent directory files before the files of
+        child directories).  Returns a positive number if file1 is before
+        file2, a negative one if it's after it and 0 if they are equal.
+        (see MemcachedZipHandler.CompareFilenames)
+    """
+    f1_segments = file1.split('/')
+    f2_segments = file2.split('/')
+
+    segment_ptr = 0
+    while (segment_ptr < len(f1_segments) and
+           segment_ptr < len(f2_segments) and
+           f1_segments[segment_ptr] == f2_segments[segment_ptr]):
+        segment_ptr += 1
+
+    if len(f1_segments) == len(f2_segments) and segment_ptr == len(f1_segments):
+        return 0 # the paths are the same
+
+    # files come before directories
+    if len(f1_segments) != len(f2_segments) and (
+        segment_ptr + 1 == len(f1_segments) or segment_ptr + 1 == len(f2_segments)):
+        return len(f2_segments) - len(f1_segments)
+
+    return cmp(f2_segments[segment_ptr], f1_segments[segment_ptr])
+
+def read_raw(archive, info):
+    """ Returns the compressed data of the member 'info' of the opened
+        ZipFile, as it is stored in the archive
+    """
+    archive.fp.seek(info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, archive.fp.read(zipfile.sizeFileHeader))
+    if header[0] != zipfile.stringFileHeader:
+        raise zipfile.BadZipfile('Bad magic number for file header')
+    # the extra field of the local header may differ from the central directory
+    archive.fp.seek(header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH], 1)
+    return archive.fp.read(info.compress_size)
+
+def wrap_gzip(deflated, crc, size, lastmod):
+    """ Returns the raw deflate stream as gzip file (RFC 1952)
+    """
+    header = '\x1f\x8b\x08\x00' + struct.pack('<L', calendar.timegm(lastmod.timetuple())) + '\x00\xff'
+    return header + deflated + struct.pack('<LL', crc & 0xffffffff, size & 0xffffffff)
+
+# The zip archives opened by this process, (pid, filename) -> (ZipFile, lock)
+_archives = {}
+_archives_lock = threading.Lock()
+
+def open_archive(filename):
+    """ Returns a tuple of the (per process) opened ZipFile and the
+        lock that has to be held when reading from it, or (None, None)
+        if the archive can't be opened.
+    """
+    key = (os.getpid(), filename) # forked processes must not share the file position
+    try:
+        return _archives[key]
+    except KeyError:
+        pass
+    _archives_lock.acquire()
+    try:
+        if key not in _archives:
+            try:
+                _archives[key] = (zipfile.ZipFile(filename), threading.Lock())
+            except (IOError, RuntimeError, zipfile.BadZipfile), e:
+                logging.error('Can\'t open zipfile %s, cause: %s' % (filename, e))
+                return None, None
+        return _archives[key]
+    finally:
+        _archives_lock.release()
+
+def build_manifest(zip_files):
+    """ Returns the manifest of the archives: a dict mapping each zipped
+        file to its archive (the file name relative to the manifest),
+        crc, size, mtime (seconds since the epoch) and mimetype.
+    """
+    files = {}
+    for zip_file in zip_files:
+        archive = zipfile.ZipFile(zip_file)
+        try:
+            for info in archive.infolist():
+                if info.filename.endswith('/') or info.filename in files:
+                    continue # directories, the first archive containing a file wins
+                files[info.filename] = {
+                    'archive': os.path.basename(zip_file),
+                    'crc': info.CRC,
+                    'size': info.file_size,
+                    'mtime': calendar.timegm(info.date_time),
+                    'mimetype': mimetypes.guess_type(info.filename)[0],
+                    'deflated': info.compress_type == zipfile.ZIP_DEFLATED,
+                }
+        finally:
+            archive.close()
+    return {'version': 1, 'files': files}
+
+def write_manifest(zip_files, filename):
+    manifest = build_manifest(zip_files)
+    f = open(filename, 'w')
+    try:
+        json.dump(manifest, f, sort_keys=True, separators=(',', ':'))
+    finally:
+        f.close()
+    return manifest
+
+def load_manifest(filename):
+    """ Returns a dict mapping the file names of a manifest written by
+        write_manifest to their FileInfo, the archives are expected in the
+        folder of the manifest.
+    """
+    f = open(filename)
+    try:
+        manifest = json.load(f)
+    finally:
+        f.close()
+    base_dir = os.path.dirname(os.path.abspath(filename))
+    files = {}
+    for name, data in manifest['files'].items():
+        files[name] = FileInfo(os.path.join(base_dir, data['archive']), data['crc'], data['size'],
+                               datetime.datetime.utcfromtimestamp(data['mtime']),
+                               data['mimetype'] and str(data['mimetype']), # headers must be str
+                               data.get('deflated', False))
+    return files
+
+def create_server(release_dir, **kwargs):
+    """ Returns a ZipServer of all zip archives within the release_dir,
+        using its manifest if there is one.  The keyword arguments are
+        passed to ZipServer.
+    """
+    zip_files = [ os.path.join(release_dir, name) for name in sorted(os.listdir(release_dir))
+                  if name.endswith('.zip') ]
+    manifest = os.path.join(release_dir, MANIFEST_NAME)
+    if 'manifest' not in kwargs and os.path.exists(manifest):
+        kwargs['manifest'] = manifest
+    return ZipServer(zip_files, **kwargs)
+
+class ZipServer(object):
+    """ Serves GET requests from a list of zip archives.
+
+        Arguments:
+
+            zip_files:
+                A list of zip file names, or a list of lists [file name, first member],
+                the first member is used to find the archive of a file without
+                trying all of them (see MemcachedZipHandler.MapFileToArchive)
+
+            max_age (optional):
+                The maximum client-side cache lifetime in seconds (default 600).
+
+            public (optional):
+                Whether the files are declared public for caches (default True).
+
+            client_caching (optional):
+                Whether Last-Modified and ETag headers are sent and conditional
+                requests answered with '304 Not Modified' (default True).
+
+            memory_cache_size (optional):
+                Maximum size (in bytes) of the files cached within the process
+                (default 16MB).
+
+            cache_timeout (optional):
+                If set, the files are also put into the Django cache for that
+                many seconds, as second tier shared by all processes.
+
+            manifest (optional):
+                The file name of a manifest written by write_manifest (ie by
+                dojobuild --prepare_zipserve), it's loaded at startup.
+
+            gzip (optional):
+                Whether deflated files are sent gzip encoded to clients
+                accepting it (default True).
+    """
+    CACHE_PREFIX = 'dojango.zipserve.'
+
+    def __init__(self, zip_files, max_age=600, public=True, client_caching=True,
+                 memory_cache_size=16 * 1024 * 1024, cache_timeout=None, manifest=None,
+                 gzip=True):
+        if not isinstance(zip_files, (list, tuple)):
+            raise ValueError('File name arguments must be a list')
+        self.zip_files = [ isinstance(f, (list, tuple)) and list(f) or [f] for f in zip_files ]
+        self.max_age = max_age
+        self.public = public
+        self.client_caching = client_caching
+        self.cache_timeout = cache_timeout
+        self.manifest = manifest and load_manifest(manifest) or None
+        self.gzip = gzip
+        self._files = LRUCache(memory_cache_size, get_size=len)
+        self._missing = LRUCache(1000) # negative cache
+
+    def preprocess_path(self, name):
+        """ Requests for a directory serve its index.html
+        """
+        if not name or name.endswith('/'):
+            return name + 'index.html'
+        return name
+
+    def get_info(self, name):
+        """ Returns the FileInfo of the file or None if it doesn't exist.
+            Only the directories of the archives are read for it (or
+            nothing at all, if there's a manifest).
+        """
+        if self.manifest is not None:
+            return self.manifest.get(name)
+        if name in self._missing:
+            return None
+        for archive_name in self.get_archives(name):
+            archive, lock = open_archive(archive_name)
+            if archive is None:
+                continue
+            try:
+                return FileInfo.from_zipinfo(archive_name, archive.getinfo(name))
+            except KeyError:
+                pass
+        self._missing.set(name, True)
+        return None
+
+    def get_data(self, name, info, gzip=False):
+        """ Returns the content of the file (gzip encoded if 'gzip' is set),
+            from the process cache, the Django cache or its archive (in that order)
+        """
+        key = (name, gzip and info.gzip_etag or info.etag)
+        data = self._files.get(key)
+        if data is not None:
+            return data
+
+        cache_key = None
+        if self.cache_timeout:
+            from django.core.cache import cache
+            cache_key = self.CACHE_PREFIX + md5('%s:%s' % key).hexdigest()
+            data = cache.get(cache_key)
+
+        if data is None:
+            data = self.read_file(info.archive, name, gzip)
+            if data is None:
+                return None
+            if cache_key:
+                cache.set(cache_key, data, self.cache_timeout)
+
+        self._files.set(key, data)
+        return data
+
+    def map_file_to_archive(self, name):
+        """ Returns the archive the file is expected in (or None)
+        """
+        for target in reversed(self.zip_files):
+            if len(target) > 1 and compare_filenames(target[1], name) >= 0:
+                return target[0]
+        return None
+
+    def get_archives(self, name):
+        """ Returns the archives to search for the file, starting with
+            the one given by map_file_to_archive
+        """
+        archives = [ target[0] for target in self.zip_files ]
+        expected = self.map_file_to_archive(name)
+        if expected:
+            archives.remove(expected)
+            archives.insert(0, expected)
+        return archives
+
+    def read_file(self, archive_name, name, gzip=False):
+        archive, lock = open_archive(archive_name)
+        if archive is None:
+            return None
+        lock.acquire()
+        try:
+            try:
+                if not gzip:
+                    return archive.read(name)
+                info = archive.getinfo(name)
+                return wrap_gzip(read_raw(archive, info), info.CRC, info.file_size,
+                                 datetime.datetime(*info.date_time))
+            except (KeyError, RuntimeError, zipfile.BadZipfile):
+                return None
+        finally:
+            lock.release()
+
+    def get_caching_headers(self, info, etag):
+        headers = [('Expires', email.Utils.formatdate(time.time() + self.max_age, usegmt=True))]
+        cache_control = []
+        if self.public:
+            cache_control.append('public')
+        cache_control.append('max-age=%d' % self.max_age)
+        headers.append(('Cache-Control', ', '.join(cache_control)))
+        if self.client_caching:
+            headers.append(('Last-Modified', info.lastmod.strftime("%a, %d %b %Y %H:%M:%S GMT")))
+            headers.append(('ETag', etag))
+        if self.gzip:
+            headers.append(('Vary', 'Accept-Encoding'))
+        return headers
+
+    def is_not_modified(self, info, etag, if_none_match=None, if_modified_since=None):
+        if not self.client_caching:
+            return False
+        if if_none_match is not None:
+            return etag_matches(etag, if_none_match)
+        if if_modified_since:
+            parsed = email.Utils.parsedate(if_modified_since.split(';')[0])
+            if parsed and datetime.datetime(*parsed[:6]) >= info.lastmod:
+                return True
+        return False
+
+    def serve(self, name, if_none_match=None, if_modified_since=None, accept_encoding=None):
+        """ Returns a tuple (status code, list of headers, body)
+            for a request of the file
+        """
+        name = self.preprocess_path(name)
+        info = self.get_info(name)
+        if info is not None:
+            gzip = self.gzip and info.deflated and accepts_gzip(accept_encoding)
+            etag = gzip and info.gzip_etag or info.etag
+            headers = self.get_caching_headers(info, etag)
+            if self.is_not_modified(info, etag, if_none_match, if_modified_since):
+                return 304, headers, ''
+            data = self.get_data(name, info, gzip)
+            if data is not None:
+                if gzip:
+                    headers.append(('Content-Encoding', 'gzip'))
+                headers.append(('Content-Type', info.mimetype))
+                headers.append(('Content-Length', str(len(data))))
+                return 200, headers, data
+        return 404, [('Content-Type', 'text/plain')], 'Error 404, file not found'
+
+    def django_view(self, request, path):
+        from django.http import HttpResponse
+        status, headers, body = self.serve(path,
+            request.META.get('HTTP_IF_NONE_MATCH'), request.META.get('HTTP_IF_MODIFIED_SINCE'),
+            request.META.get('HTTP_ACCEPT_ENCODING'))
+        response = HttpResponse(body, status=status)
+        for header, value in headers:
+            response[header] = value
+        return response
+
+    _status_texts = {200: '200 OK', 304: '304 Not Modified', 404: '404 Not Found'}
+
+    def wsgi_app(self, environ, start_response):
+        if environ.get('REQUEST_METHOD', 'GET') not in ('GET', 'HEAD'):
+            start_response('405 Method Not Allowed', [('Allow', 'GET, HEAD')])
+            return []
+        status, headers, body = self.serve(environ.get('PATH_INFO', '').lstrip('/'),
+            environ.get('HTTP_IF_NONE_MATCH'), environ.get('HTTP_IF_MODIFIED_SINCE'),
+            environ.get('HTTP_ACCEPT_ENCODING'))
+        start_response(self._status_texts[status], headers)
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return []
+        return [body]